@@ -0,0 +1,344 @@
+# benchmarks/apz_benchmark.py
+"""
+Benchmarks the text overlay pipeline without ComfyUI, on synthetic frames and the
+system DejaVu fonts.
+
+    python benchmarks/apz_benchmark.py                      # default sweeps
+    python benchmarks/apz_benchmark.py --quick --save base.json
+    python benchmarks/apz_benchmark.py --compare base.json  # exit status 1 on regressions
+
+Each parameter (text length, max_font_size, batch size, frame resolution, box size) is
+swept on its own while the others keep their defaults. Every case reports the time of
+each stage, frames/s of the node in each render mode, peak extra memory, font loads
+and getbbox calls. Caches are cleared before every run unless --warm is given. The
+import time of the package in a fresh interpreter is reported as well.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+# Layers read back from a disk cache would hide the rendering cost
+os.environ.pop("APZ_RENDER_CACHE_DIR", None)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+
+DEFAULTS = {"words": 60, "max_font_size": 64, "batch": 8, "resolution": "1280x720", "box": "600x300"}
+SWEEPS = {
+    "words": [10, 60, 300],
+    "max_font_size": [32, 64, 128],
+    "batch": [1, 8, 32],
+    "resolution": ["640x360", "1280x720", "1920x1080"],
+    "box": ["300x150", "600x300", "1200x600"],
+}
+RENDER_MODES = ["batch_layer", "per_frame", "per_frame_crop", "device_layer"]
+# Slowdowns smaller than this are timer noise, whatever their ratio
+MIN_REGRESSION_MS = 0.5
+
+# Modules node registration should not load
+HEAVY_MODULES = ["torch", "numpy", "PIL.Image", "PIL.ImageFont"]
+
+_IMPORT_SCRIPT = """
+import importlib.util, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("apz_texttools", sys.argv[1] + "/__init__.py", submodule_search_locations=[sys.argv[1]])
+package = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = package
+spec.loader.exec_module(package)
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "nodes": len(package.NODE_CLASS_MAPPINGS), "loaded": [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+_VOCABULARY = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit",
+               "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna"]
+_TAGS = ["b", "i", "u", "s"]
+
+
+def load_package():
+    # The repository is the package; it is imported under a fixed name from wherever it lives
+    spec = importlib.util.spec_from_file_location("apz_texttools", os.path.join(REPO_DIR, "__init__.py"),
+                                                  submodule_search_locations=[REPO_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+def synthetic_text(words):
+    # Deterministic rich text with a styled run every few words
+    parts = []
+    for index in range(words):
+        word = _VOCABULARY[(index * 7) % len(_VOCABULARY)]
+        if index % 5 == 4:
+            tag = _TAGS[(index // 5) % len(_TAGS)]
+            word = f"<{tag}>{word}</{tag}>"
+        parts.append(word)
+    return " ".join(parts)
+
+
+def parse_size(size):
+    width, height = size.split("x")
+    return int(width), int(height)
+
+
+class PeakMemory:
+    """
+    Peak resident memory above the level at entry, sampled from /proc (Linux only;
+    `peak_mb` stays None elsewhere). Torch and PIL buffers are not seen by tracemalloc.
+    """
+
+    INTERVAL = 0.002
+
+    def __init__(self):
+        self.peak_mb = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self):
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self._page_size
+        except OSError:
+            return None
+
+    def _sample(self):
+        while not self._done.is_set():
+            rss = self._rss()
+            if rss is not None:
+                self._peak = max(self._peak, rss)
+            self._done.wait(self.INTERVAL)
+
+    def __enter__(self):
+        self._start = self._rss()
+        if self._start is not None:
+            self._peak = self._start
+            self._done = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._start is not None:
+            self._done.set()
+            self._thread.join()
+            self._peak = max(self._peak, self._rss() or 0)
+            self.peak_mb = round((self._peak - self._start) / 2 ** 20, 1)
+
+
+class Benchmark:
+    def __init__(self, package, font_dir=FONT_DIR, repeat=3, warm=False):
+        from PIL import ImageFont
+        self.pkg = package
+        self.fonts = [os.path.join(font_dir, name) for name in ("DejaVuSans.ttf", "DejaVuSans-Oblique.ttf", "DejaVuSans-Bold.ttf")]
+        # A missing italic falls back to the regular font
+        self.fonts = [path if os.path.exists(path) else self.fonts[0] for path in self.fonts]
+        self.repeat = repeat
+        self.warm = warm
+        self.getbbox_calls = 0
+
+        # Counts every getbbox call, whoever makes it
+        original_getbbox = ImageFont.FreeTypeFont.getbbox
+        benchmark = self
+
+        def counting_getbbox(font, *args, **kwargs):
+            benchmark.getbbox_calls += 1
+            return original_getbbox(font, *args, **kwargs)
+        ImageFont.FreeTypeFont.getbbox = counting_getbbox
+
+    def module(self, name):
+        # A module of the package, e.g. "utils.apz_font_manager"
+        return importlib.import_module(f"{self.pkg.__name__}.{name}")
+
+    def clear_caches(self):
+        if self.warm:
+            return
+        self.module("utils.apz_font_manager").shared_font_cache.clear()
+        self.module("utils.apz_render_cache").shared_render_cache.clear()
+        self.module("utils.apz_text_metrics").shared_text_metrics.clear()
+        self.module("utils.apz_rich_text_parser").clear_parse_cache()
+
+    def measure(self, function):
+        """
+        Runs function `repeat` times on cleared caches and returns the median time in ms with
+        the font loads, getbbox calls and peak extra memory of the last run.
+        """
+        font_cache = self.module("utils.apz_font_manager").shared_font_cache
+        times = []
+        for _ in range(self.repeat):
+            self.clear_caches()
+            font_loads, getbbox_calls = font_cache.misses, self.getbbox_calls
+            with PeakMemory() as memory:
+                start = time.perf_counter()
+                function()
+                elapsed = time.perf_counter() - start
+            times.append(elapsed * 1000)
+        return {
+            "ms": round(statistics.median(times), 3),
+            "font_loads": font_cache.misses - font_loads,
+            "getbbox": self.getbbox_calls - getbbox_calls,
+            "peak_mb": memory.peak_mb,
+        }
+
+    def run_case(self, words, max_font_size, batch, resolution, box):
+        import torch
+        from PIL import Image, ImageDraw
+
+        FontManager = self.module("utils.apz_font_manager").FontManager
+        FontLoaderUtility = self.module("utils.apz_font_loader_utility").FontLoaderUtility
+        parse_rich_text = self.module("utils.apz_rich_text_parser").parse_rich_text
+        wrap_text = self.module("utils.apz_text_wrapper").wrap_text
+        image_conversion = self.module("utils.apz_image_conversion")
+        TextRendererUtility = self.module("utils.apz_text_renderer_utility").TextRendererUtility
+        ColorUtility = self.module("utils.apz_color_utility").ColorUtility
+        node = self.module("nodes.apzImageRichTextOverlay").APZmediaImageRichTextOverlay
+
+        text = synthetic_text(words)
+        frame_width, frame_height = parse_size(resolution)
+        box_width, box_height = parse_size(box)
+        padding, line_height_ratio = 10, 1.2
+        effective_width, effective_height = box_width - 2 * padding, box_height - 2 * padding
+        torch.manual_seed(0)
+        image = torch.rand(batch, frame_height, frame_width, 3)
+
+        stages = {}
+        font_manager = FontManager(*self.fonts, max_font_size)
+        stages["parse_rich_text"] = self.measure(lambda: parse_rich_text(text))
+
+        fitted = {}
+        def fit():
+            font_loader = FontLoaderUtility(font_manager, max_font_size)
+            fitted["result"] = font_loader.find_fitting_font_size(text, effective_width, effective_height, line_height_ratio)
+            fitted["wrap_passes"] = font_loader.wrap_passes
+        stages["find_fitting_font_size"] = self.measure(fit)
+        stages["find_fitting_font_size"]["wrap_passes"] = fitted["wrap_passes"]
+        font_size, wrapped_lines, _ = fitted["result"]
+
+        if font_size:
+            parsed_text = parse_rich_text(text)
+            stages["wrap_text"] = self.measure(lambda: wrap_text(
+                parsed_text, font_manager.get_regular_font(font_size), effective_width, int(font_size * line_height_ratio)))
+
+            canvas = Image.new("RGB", (box_width, box_height))
+            stages["render_text"] = self.measure(lambda: TextRendererUtility.render_text(
+                ImageDraw.Draw(canvas, "RGBA"), wrapped_lines, 0, 0, padding, box_width, box_height, font_manager,
+                ColorUtility(), "center", "middle", line_height_ratio, (255, 255, 255), (255, 0, 0), (0, 255, 0)))
+
+        pil_images = image_conversion.tensor_to_pil(image)
+        stages["tensor_to_pil"] = self.measure(lambda: image_conversion.tensor_to_pil(image))
+        stages["pil_to_tensor"] = self.measure(lambda: image_conversion.pil_to_tensor(pil_images))
+        del pil_images
+
+        node_inputs = dict(
+            theText=text, theTextbox_width=box_width, theTextbox_height=box_height, max_font_size=max_font_size,
+            font=self.fonts[0], italic_font=self.fonts[1], bold_font=self.fonts[2], alignment="center",
+            vertical_alignment="middle", font_color="#FFFFFF", italic_font_color="#FF0000", bold_font_color="#00FF00",
+            box_start_x=(frame_width - box_width) // 2, box_start_y=(frame_height - box_height) // 2, padding=padding,
+            line_height_ratio=line_height_ratio, show_bounding_box="true", bounding_box_color="#0000FF", line_width=3,
+            line_opacity=0.7, box_background_color="#000000", box_opacity=0.5,
+        )
+        for render_mode in RENDER_MODES:
+            result = self.measure(lambda: node().apz_add_text_overlay(image, **node_inputs, render_mode=render_mode))
+            result["fps"] = round(batch / (result["ms"] / 1000), 2) if result["ms"] else None
+            stages[f"node[{render_mode}]"] = result
+        return stages
+
+
+def measure_import(repeat=3):
+    """
+    Time to import the package and register its nodes in a fresh interpreter (median
+    of `repeat` runs), and which heavy modules that import loaded.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT, REPO_DIR, json.dumps(HEAVY_MODULES)],
+                                check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {"ms": round(statistics.median(run["ms"] for run in runs), 3), "nodes": runs[-1]["nodes"], "heavy_modules": runs[-1]["loaded"]}
+
+
+def case_name(config):
+    return " ".join(f"{key}={config[key]}" for key in DEFAULTS)
+
+
+def sweep_configs(quick=False):
+    # One sweep per parameter around the defaults; the default case is only run once
+    configs = {case_name(DEFAULTS): dict(DEFAULTS)}
+    if not quick:
+        for key, values in SWEEPS.items():
+            for value in values:
+                config = dict(DEFAULTS, **{key: value})
+                configs.setdefault(case_name(config), config)
+    return configs
+
+
+def print_case(name, stages, baseline=None, threshold=1.1):
+    # Returns the stages slower than threshold times the baseline
+    print(f"\n{name}")
+    regressions = []
+    for stage, result in stages.items():
+        line = f"  {stage:<24} {result['ms']:>10.2f} ms"
+        if "fps" in result:
+            line += f" {result['fps']:>8.2f} fps"
+        if "font_loads" in result:
+            line += f"  font loads {result['font_loads']:>3}  getbbox {result['getbbox']:>6}"
+        if "heavy_modules" in result:
+            line += f"  nodes {result['nodes']}  heavy modules loaded: {', '.join(result['heavy_modules']) or 'none'}"
+        if result.get("peak_mb") is not None:
+            line += f"  peak {result['peak_mb']:>8.1f} MB"
+        if "wrap_passes" in result:
+            line += f"  wrap passes {result['wrap_passes']}"
+        previous = (baseline or {}).get(name, {}).get(stage)
+        if previous and previous["ms"] > 0:
+            ratio = result["ms"] / previous["ms"]
+            line += f"  x{ratio:.2f} vs baseline"
+            if ratio > threshold and result["ms"] - previous["ms"] > MIN_REGRESSION_MS:
+                line += "  REGRESSION"
+                regressions.append((name, stage, ratio))
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the APZmedia text overlay pipeline.")
+    parser.add_argument("--quick", action="store_true", help="only run the default case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the median is reported")
+    parser.add_argument("--warm", action="store_true", help="keep font, metrics and render caches between runs")
+    parser.add_argument("--font-dir", default=FONT_DIR, help="directory with the DejaVu fonts")
+    parser.add_argument("--save", metavar="PATH", help="write the results as JSON, e.g. as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare stage times with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=1.1, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    package = load_package()
+    benchmark = Benchmark(package, args.font_dir, args.repeat, args.warm)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["cases"]
+
+    # Startup runs first, before this process has imported anything itself
+    results = {"startup": {"import": measure_import(args.repeat)}}
+    regressions = print_case("startup", results["startup"], baseline, args.threshold)
+    for name, config in sweep_configs(args.quick).items():
+        results[name] = benchmark.run_case(**config)
+        regressions += print_case(name, results[name], baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump({"repeat": args.repeat, "warm": args.warm, "cases": results}, results_file, indent=2)
+        print(f"\nSaved results to {args.save}")
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than x{args.threshold} of the baseline:")
+        for name, stage, ratio in regressions:
+            print(f"  {name}: {stage} x{ratio:.2f}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+from ..utils.apz_instrumentation import shared_instrumentation
+from ..utils.apz_text_batch_utility import TextBatchUtility
+from .apzImageRichTextOverlay import APZmediaImageRichTextOverlay
+
+_default_boxes = [
+    {"theText": "<b>Title</b>", "theTextbox_width": 512, "theTextbox_height": 120, "max_font_size": 64, "box_start_x": 0, "box_start_y": 0, "padding": 10},
+    {"theText": "<i>Subtitle</i>", "theTextbox_width": 512, "theTextbox_height": 80, "max_font_size": 40, "box_start_x": 0, "box_start_y": 120, "padding": 10},
+]
+
+class APZmediaImageMultiBoxTextOverlay:
+    """
+    Draws several text boxes on each frame in a single pass. Every box is a JSON object
+    using the input names of APZmediaImageRichTextOverlay; missing keys take that node's
+    defaults. theText may also be a list of strings, one per frame.
+    """
+    def __init__(self, device="cpu"):
+        self.device = device
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "boxes": ("STRING", {"multiline": True, "default": json.dumps(_default_boxes, indent=2)}),
+            },
+            "optional": {
+                "render_mode": (APZmediaImageRichTextOverlay._render_modes, {"default": "batch_layer"}),
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64}),
+                "chunk_size": ("INT", {"default": 0, "min": 0, "max": 4096}),
+                "start_frame": ("INT", {"default": 0, "min": 0}),
+                "frame_rate": ("FLOAT", {"default": 24.0, "min": 1.0, "max": 240.0}),
+                "dynamic_text": (APZmediaImageRichTextOverlay._dynamic_text_modes, {"default": "reserve"}),
+            }
+        }
+
+    @classmethod
+    def IS_CHANGED(cls, boxes=None, **kwargs):
+        # Other inputs are compared by ComfyUI itself; editing a font file must re-run the node too
+        try:
+            settings = [cls.box_settings(box, index) for index, box in enumerate(json.loads(boxes))]
+        except (TypeError, ValueError):
+            return ""  # The execution reports invalid boxes
+        from ..utils.apz_font_manager import FontManager
+        return FontManager.files_signature([box[name] for box in settings for name in ("font", "italic_font", "bold_font")])
+
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "apz_add_multi_box_overlay"
+    CATEGORY = "image/text"
+
+    @staticmethod
+    def check_box_value(index, name, value, options):
+        # Box JSON bypasses ComfyUI's input validation, so values are checked against the single-box inputs here
+        kind, limits = options
+        if name == "theText":
+            valid = isinstance(value, str) or (isinstance(value, list) and value and all(isinstance(text, str) for text in value))
+            expected = "a string or a non-empty list of strings"
+        elif isinstance(kind, list):
+            valid = value in kind
+            expected = f"one of {', '.join(kind)}"
+        elif kind in ("INT", "FLOAT"):
+            number_types = (int,) if kind == "INT" else (int, float)
+            valid = (isinstance(value, number_types) and not isinstance(value, bool)
+                     and limits.get("min", value) <= value <= limits.get("max", value))
+            bounds = [f"{label} {limits[key]}" for key, label in (("min", ">="), ("max", "<=")) if key in limits]
+            expected = " ".join(["an integer" if kind == "INT" else "a number"] + ([", ".join(bounds)] if bounds else []))
+        else:
+            valid = isinstance(value, str)
+            expected = "a string"
+        if not valid:
+            raise ValueError(f"Box {index}: {name} must be {expected}, got {value!r}")
+
+    @staticmethod
+    def box_settings(box, index=0):
+        # Settings of one box, filled in with the single-box node defaults
+        box_inputs = APZmediaImageRichTextOverlay.INPUT_TYPES()["required"]
+        settings = {name: options[1]["default"] for name, options in box_inputs.items() if name != "image"}
+        if not isinstance(box, dict):
+            raise ValueError(f"Box {index} must be a JSON object, got {box!r}")
+        unknown = sorted(set(box) - set(settings))
+        if unknown:
+            raise ValueError(f"Box {index}: unknown box settings: {', '.join(unknown)}")
+        for name, value in box.items():
+            APZmediaImageMultiBoxTextOverlay.check_box_value(index, name, value, box_inputs[name])
+        settings.update(box)
+        return settings
+
+    def apz_add_multi_box_overlay(self, image, boxes, render_mode="batch_layer", workers=0, chunk_size=0, start_frame=0, frame_rate=24.0, dynamic_text="reserve"):
+        # Loaded on first execution, like in APZmediaImageRichTextOverlay
+        from ..utils.apz_overlay_renderer import OverlayRendererUtility
+
+        with shared_instrumentation.execution("APZmediaImageMultiBoxTextOverlay", frames=image.shape[0], render_mode=render_mode):
+            box_list = json.loads(boxes)
+            if not isinstance(box_list, list):
+                raise ValueError("boxes must be a JSON list of box objects")
+
+            builders = []
+            box_texts = []
+            for index, box in enumerate(box_list):
+                settings = self.box_settings(box, index)
+                text = settings.pop("theText")
+                box_texts.append(text if isinstance(text, list) else [text])
+                builders.append(OverlayRendererUtility.layout_builder(**settings))
+
+            longest = max((len(texts) for texts in box_texts), default=1)
+            if longest > 1 and image.shape[0] == 1:
+                # A single image captioned with several texts becomes one frame per text;
+                # the expanded view shares the image memory
+                image = image.expand(longest, -1, -1, -1)
+            frame_count = image.shape[0]
+
+            # Each distinct text of a box is laid out once
+            box_frame_layouts = [
+                OverlayRendererUtility.layout_frames(build_layout, TextBatchUtility.assign_frame_texts(texts, frame_count), workers, start_frame, frame_rate, dynamic_text)
+                for build_layout, texts in zip(builders, box_texts)
+            ]
+            frame_layouts = [sum((layouts[index] for layouts in box_frame_layouts), ()) for index in range(frame_count)]
+            return OverlayRendererUtility.render(image, frame_layouts, render_mode, workers, chunk_size),
@@ -1,19 +1,19 @@
-import torch
-from PIL import ImageDraw
-from ..utils.apz_color_utility import ColorUtility
-from ..utils.apz_font_loader_utility import FontLoaderUtility
-from ..utils.apz_text_renderer_utility import TextRendererUtility
-from ..utils.apz_image_conversion import tensor_to_pil, pil_to_tensor
-from ..utils.apz_font_manager import FontManager
-from ..utils.apz_box_utility import BoxUtility
+import logging
+from ..utils.apz_instrumentation import shared_instrumentation
+from ..utils.apz_text_batch_utility import TextBatchUtility
+
+logger = logging.getLogger(__name__)
 
 class APZmediaImageRichTextOverlay:
     def __init__(self, device="cpu"):
-        print("APZmediaImageRichTextOverlay initialized")
+        logger.debug("APZmediaImageRichTextOverlay initialized")
         self.device = device
 
     _alignments = ["left", "right", "center"]
     _vertical_alignments = ["top", "middle", "bottom"]
+    _render_modes = ["batch_layer", "per_frame", "per_frame_crop", "device_layer"]
+    _text_batch_modes = ["single", "lines", "json"]
+    _dynamic_text_modes = ["reserve", "fixed", "reflow"]
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -42,54 +42,55 @@ class APZmediaImageRichTextOverlay:
                 "line_opacity": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.1}),  # Opacity for the line
                 "box_background_color": ("STRING", {"default": "#FFFFFF"}),  # Background color default to white
                 "box_opacity": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.1}),
+            },
+            "optional": {
+                # batch_layer rasterizes the text once and blends it into every frame,
+                # per_frame_crop draws each frame but only converts the box region,
+                # device_layer blends on the input's device and dtype
+                "render_mode": (cls._render_modes, {"default": "batch_layer"}),
+                # Threads for the per-frame modes, 0 picks a count from the batch size and frame area
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64}),
+                # lines/json give one text per frame; identical texts share one layout
+                "text_batch_mode": (cls._text_batch_modes, {"default": "single"}),
+                # Frames converted and drawn at a time, 0 picks a count from the frame size
+                "chunk_size": ("INT", {"default": 0, "min": 0, "max": 4096}),
+                # {frame}, {index} and {timecode} in theText expand per frame
+                "start_frame": ("INT", {"default": 0, "min": 0}),
+                "frame_rate": ("FLOAT", {"default": 24.0, "min": 1.0, "max": 240.0}),
+                # reserve/fixed lay the text out once with room for every value, reflow lays out each frame
+                "dynamic_text": (cls._dynamic_text_modes, {"default": "reserve"}),
             }
         }
 
+    @classmethod
+    def IS_CHANGED(cls, font=None, italic_font=None, bold_font=None, **kwargs):
+        # Other inputs are compared by ComfyUI itself; editing a font file must re-run the node too
+        from ..utils.apz_font_manager import FontManager
+        return FontManager.files_signature([font, italic_font, bold_font])
+
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "apz_add_text_overlay"
     CATEGORY = "image/text"
 
-    def apz_add_text_overlay(self, image, theText, theTextbox_width, theTextbox_height, max_font_size, font, italic_font, bold_font, alignment, vertical_alignment, font_color, italic_font_color, bold_font_color, box_start_x, box_start_y, padding, line_height_ratio, show_bounding_box, bounding_box_color, line_width, line_opacity, box_background_color, box_opacity):
-        pil_images = tensor_to_pil(image)
-        color_utility = ColorUtility()
-
-        font_color_rgb = color_utility.hex_to_rgb(font_color)
-        italic_font_color_rgb = color_utility.hex_to_rgb(italic_font_color)
-        bold_font_color_rgb = color_utility.hex_to_rgb(bold_font_color)
-
-        font_manager = FontManager(font, italic_font, bold_font, max_font_size)
-        font_loader = FontLoaderUtility(font_manager, max_font_size)
-
-        processed_images = []
-        for idx, image_pil in enumerate(pil_images):
-            # Calculate box coordinates
-            box_left, box_top, box_right, box_bottom = BoxUtility.calculate_box_coordinates(box_start_x, box_start_y, theTextbox_width, theTextbox_height)
-
-            # Calculate the effective box coordinates considering padding
-            effective_box_left, effective_box_top, effective_box_right, effective_box_bottom = BoxUtility.calculate_effective_box_coordinates(box_start_x, box_start_y, theTextbox_width, theTextbox_height, padding)
-
-            draw = ImageDraw.Draw(image_pil, "RGBA")
-
-            # Draw the bounding box if the option is enabled
-            if show_bounding_box == "true":
-                effective_box_rgb = color_utility.hex_to_rgb(bounding_box_color) + (int(line_opacity * 255),)
-                box_background_rgb = color_utility.hex_to_rgb(box_background_color) + (int(box_opacity * 255),)
-                BoxUtility.draw_bounding_box(draw, effective_box_left, effective_box_top, effective_box_right, effective_box_bottom, effective_box_rgb, box_background_rgb, line_width)
-                
-            # Find the font size and wrap the lines
-            font_size, wrapped_lines, total_text_height = font_loader.find_fitting_font_size(theText, theTextbox_width - 2 * padding, theTextbox_height - 2 * padding, line_height_ratio)
+    def apz_add_text_overlay(self, image, theText, theTextbox_width, theTextbox_height, max_font_size, font, italic_font, bold_font, alignment, vertical_alignment, font_color, italic_font_color, bold_font_color, box_start_x, box_start_y, padding, line_height_ratio, show_bounding_box, bounding_box_color, line_width, line_opacity, box_background_color, box_opacity, render_mode="batch_layer", workers=0, text_batch_mode="single", chunk_size=0, start_frame=0, frame_rate=24.0, dynamic_text="reserve"):
+        # The renderer pulls in torch, NumPy and the fonts; loading it here keeps node registration light
+        from ..utils.apz_overlay_renderer import OverlayRendererUtility
 
-            if font_size:
-                TextRendererUtility.render_text(
-                    draw, wrapped_lines, box_left, box_top, padding,
-                    box_right - box_left, box_bottom - box_top, font_manager,
-                    color_utility, alignment, vertical_alignment, line_height_ratio,
-                    font_color_rgb, italic_font_color_rgb, bold_font_color_rgb
-                )
+        with shared_instrumentation.execution("APZmediaImageRichTextOverlay", frames=image.shape[0], render_mode=render_mode):
+            build_layout = OverlayRendererUtility.layout_builder(
+                theTextbox_width, theTextbox_height, max_font_size, font, italic_font, bold_font,
+                alignment, vertical_alignment, font_color, italic_font_color, bold_font_color,
+                box_start_x, box_start_y, padding, line_height_ratio, show_bounding_box,
+                bounding_box_color, line_width, line_opacity, box_background_color, box_opacity
+            )
 
-            processed_image = pil_to_tensor(image_pil)
-            processed_images.append(processed_image)
+            texts = TextBatchUtility.split_texts(theText, text_batch_mode)
+            if len(texts) > 1 and image.shape[0] == 1:
+                # A single image captioned with several texts becomes one frame per text;
+                # the expanded view shares the image memory
+                image = image.expand(len(texts), -1, -1, -1)
+            frame_texts = TextBatchUtility.assign_frame_texts(texts, image.shape[0])
+            frame_layouts = OverlayRendererUtility.layout_frames(build_layout, frame_texts, workers, start_frame, frame_rate, dynamic_text)
 
-        final_tensor = torch.cat(processed_images, dim=0)  # Concatenate along the batch dimension
-        return final_tensor,
+            return OverlayRendererUtility.render(image, frame_layouts, render_mode, workers, chunk_size),
 #IT WORKS
\ No newline at end of file
@@ -50,6 +50,7 @@ try:
         entry_points={
             'comfyui.custom_nodes': [
                 'APZmediaImageRichTextOverlay = nodes.apzImageRichTextOverlay:APZmediaImageRichTextOverlay',
+                'APZmediaImageMultiBoxTextOverlay = nodes.apzImageMultiBoxTextOverlay:APZmediaImageMultiBoxTextOverlay',
             ]
         }
     )
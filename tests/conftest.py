@@ -0,0 +1,13 @@
+# tests/conftest.py
+import importlib.util
+import os
+import sys
+
+# The repository is a ComfyUI custom node package; load it under a fixed name, as the benchmarks do
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "apz_texttools" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("apz_texttools", os.path.join(REPO_DIR, "__init__.py"),
+                                                  submodule_search_locations=[REPO_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = package
+    spec.loader.exec_module(package)
@@ -0,0 +1,53 @@
+# tests/reference.py
+# The original algorithms, kept to check that the optimized ones give the same results
+
+
+def wrap_text(parsed_text, font, max_width, line_height):
+    # Measures every candidate line with getbbox
+    wrapped_lines = []
+    current_line = ""
+    line_parts = []
+
+    def place_word(word, styles, followed_by_space):
+        nonlocal current_line, line_parts
+        test_line = current_line + ' ' + word if current_line else word
+        bbox = font.getbbox(test_line)
+        if bbox[2] - bbox[0] <= max_width:
+            current_line = test_line
+            if current_line.strip():
+                line_parts.append((word, styles))
+        else:
+            wrapped_lines.append((current_line, line_parts))
+            current_line = word
+            line_parts = [(word, styles)]
+        if followed_by_space:
+            line_parts.append((' ', styles))
+
+    for text, styles in parsed_text:
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            subwords = word.split('\n')
+            for j, subword in enumerate(subwords):
+                if j > 0:
+                    wrapped_lines.append((current_line, line_parts))
+                    current_line = ""
+                    line_parts = []
+                place_word(subword, styles, i < len(words) - 1 or j < len(subwords) - 1)
+
+        if text.endswith(' '):
+            current_line += ' '
+            line_parts.append((' ', styles))
+
+    if current_line:
+        wrapped_lines.append((current_line, line_parts))
+
+    return wrapped_lines, len(wrapped_lines) * line_height
+
+
+def find_fitting_font_size(font_manager, parsed_text, max_font_size, max_width, max_height, line_height_ratio):
+    # Tries every size from max_font_size down and returns the first that fits
+    for font_size in range(max_font_size, 0, -1):
+        wrapped_lines, total_height = wrap_text(parsed_text, font_manager.get_regular_font(font_size), max_width, int(font_size * line_height_ratio))
+        if total_height <= max_height:
+            return font_size, wrapped_lines, total_height
+    return None, None, None
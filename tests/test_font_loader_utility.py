@@ -0,0 +1,59 @@
+# tests/test_font_loader_utility.py
+import os
+import random
+
+import pytest
+
+import reference
+from apz_texttools.utils.apz_font_loader_utility import FontLoaderUtility
+from apz_texttools.utils.apz_font_manager import FontManager
+from apz_texttools.utils.apz_rich_text_parser import parse_rich_text
+
+FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+WORDS = ("lorem ipsum <b>dolor</b> sit amet, <i>consectetur adipiscing</i> elit sed do eiusmod "
+         "tempor incididunt ut labore et dolore magna aliqua WAVE").split()
+
+pytestmark = pytest.mark.skipif(not os.path.exists(FONT), reason="DejaVu fonts are not installed")
+
+
+@pytest.mark.parametrize("use_advance_table", [True, False])
+def test_fit_matches_linear_scan(use_advance_table):
+    # The estimate, galloping, bisection and MONOTONE_CHECK_WINDOW must find the size the linear scan finds
+    font_manager = FontManager(FONT, FONT, FONT, 256)
+    rng = random.Random(1)
+    for _ in range(30):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 60)))
+        if rng.random() < 0.3:
+            text = text.replace(" sit ", " sit\n")
+        width, height = rng.randint(20, 800), rng.randint(10, 600)
+        ratio, max_font_size = rng.choice([1.0, 1.2, 1.5]), rng.randint(1, 256)
+
+        font_size, wrapped_lines, total_height = FontLoaderUtility(font_manager, max_font_size, use_advance_table).find_fitting_font_size(text, width, height, ratio)
+        expected_size, expected_lines, expected_height = reference.find_fitting_font_size(font_manager, parse_rich_text(text), max_font_size, width, height, ratio)
+
+        case = (text, width, height, ratio, max_font_size)
+        assert (font_size, total_height) == (expected_size, expected_height), case
+        if expected_lines is not None:
+            assert [line for line, line_parts in wrapped_lines] == [line for line, line_parts in expected_lines], case
+
+
+class _WideAtOneSize(FontManager):
+    # Returns a wider font at wide_size, so that size does not fit while the one above it does
+    wide_size = None
+
+    def get_regular_font(self, font_size):
+        return super().get_regular_font(font_size + 8 if font_size == self.wide_size else font_size)
+
+
+@pytest.mark.parametrize("use_advance_table", [True, False])
+@pytest.mark.parametrize("width, height, max_font_size", [(300, 200, 100), (200, 300, 256), (250, 90, 40)])
+def test_fit_finds_size_above_a_gap(use_advance_table, width, height, max_font_size):
+    # Fitting need not be monotone in the font size; the search must still return the largest fitting size
+    text = "lorem ipsum dolor sit amet, consectetur adipiscing elit sed do eiusmod tempor"
+    font_manager = _WideAtOneSize(FONT, FONT, FONT, 256)
+    fitting_size = FontLoaderUtility(font_manager, max_font_size, use_advance_table).find_fitting_font_size(text, width, height, 1.2)[0]
+    font_manager.wide_size = fitting_size - 1
+
+    expected_size = reference.find_fitting_font_size(font_manager, parse_rich_text(text), max_font_size, width, height, 1.2)[0]
+    assert expected_size == fitting_size
+    assert FontLoaderUtility(font_manager, max_font_size, use_advance_table).find_fitting_font_size(text, width, height, 1.2)[0] == expected_size
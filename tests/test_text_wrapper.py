@@ -0,0 +1,28 @@
+# tests/test_text_wrapper.py
+import os
+import random
+
+import pytest
+from PIL import ImageFont
+
+import reference
+from apz_texttools.utils.apz_rich_text_parser import parse_rich_text
+from apz_texttools.utils.apz_text_wrapper import wrap_text
+
+FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+FONTS = [os.path.join(FONT_DIR, name) for name in ("DejaVuSans.ttf", "DejaVuSerif.ttf", "DejaVuSans-Bold.ttf", "DejaVuSansMono.ttf")]
+WORDS = ("lorem ipsum <b>dolor</b> sit amet, <i>consectetur adipiscing</i> elit AVAT Wo j fj T. f, "
+         "sed do eiusmod tempor incididunt ut labore et dolore magna aliqua").split(' ')
+
+pytestmark = pytest.mark.skipif(not all(os.path.exists(path) for path in FONTS), reason="DejaVu fonts are not installed")
+
+
+def test_wrap_matches_full_measurement():
+    # Running metrics and the tolerance band must break lines exactly where measuring every line does
+    rng = random.Random(2)
+    for _ in range(600):
+        text = " ".join(rng.choice(WORDS) + rng.choice(['', '', '', ' ', '\n', ' \n ']) for _ in range(rng.randint(0, 60)))
+        font = ImageFont.truetype(rng.choice(FONTS), rng.randint(4, 120))
+        max_width = rng.randint(1, 900)
+        parsed_text = parse_rich_text(text)
+        assert wrap_text(parsed_text, font, max_width, 10) == reference.wrap_text(parsed_text, font, max_width, 10), (text, font.path, font.size, max_width)
@@ -0,0 +1,63 @@
+# utils/apz_advance_table.py
+import threading
+import numpy as np
+
+
+class AdvanceTable:
+    """
+    Advance widths of one font at a reference size, indexed by codepoint, plus kerning
+    between ASCII characters. Entries are measured lazily the first time a text needs
+    them; words are then measured in one vectorized pass and scaled to any size.
+    Widths are approximate (no hinting, no bearings) and only used to narrow the fitting.
+    """
+
+    REFERENCE_SIZE = 100
+    # Kerning is tabulated between characters below this codepoint
+    KERNING_RANGE = 128
+
+    def __init__(self, font):
+        self.font = font
+        self.size = font.size
+        self._advances = np.full(256, np.nan)
+        self._kerning = np.full((self.KERNING_RANGE, self.KERNING_RANGE), np.nan)
+        self._lock = threading.Lock()
+
+    def _ensure_advances(self, codepoints):
+        end = int(codepoints.max()) + 1
+        if end > len(self._advances):
+            grown = np.full(max(end, 2 * len(self._advances)), np.nan)
+            grown[:len(self._advances)] = self._advances
+            self._advances = grown
+        missing = np.unique(codepoints[np.isnan(self._advances[codepoints])])
+        for codepoint in missing.tolist():
+            self._advances[codepoint] = self.font.getlength(chr(codepoint))
+
+    def _ensure_kerning(self, left, right):
+        missing = np.isnan(self._kerning[left, right])
+        for left_codepoint, right_codepoint in set(zip(left[missing].tolist(), right[missing].tolist())):
+            pair_advance = self.font.getlength(chr(left_codepoint) + chr(right_codepoint))
+            self._kerning[left_codepoint, right_codepoint] = pair_advance - self._advances[left_codepoint] - self._advances[right_codepoint]
+
+    def measure_words(self, words, font_size):
+        """
+        Returns a float array with the approximate advance width of every word at font_size.
+        """
+        widths = np.zeros(len(words))
+        text = "".join(words)
+        if not text:
+            return widths
+
+        codepoints = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.intp)
+        word_ids = np.repeat(np.arange(len(words)), [len(word) for word in words])
+        with self._lock:
+            self._ensure_advances(codepoints)
+            widths += np.bincount(word_ids, weights=self._advances[codepoints], minlength=len(words))
+
+            # Kerning between neighbouring characters of the same word
+            pairs = (word_ids[1:] == word_ids[:-1]) & (codepoints[1:] < self.KERNING_RANGE) & (codepoints[:-1] < self.KERNING_RANGE)
+            if pairs.any():
+                left, right = codepoints[:-1][pairs], codepoints[1:][pairs]
+                self._ensure_kerning(left, right)
+                widths += np.bincount(word_ids[1:][pairs], weights=self._kerning[left, right], minlength=len(words))
+
+        return widths * (font_size / self.size)
@@ -24,6 +24,15 @@ class BoxUtility:
         effective_box_bottom = box_start_y + theTextbox_height - padding
         return effective_box_left, effective_box_top, effective_box_right, effective_box_bottom
 
+    @staticmethod
+    def clip_box_coordinates(box_left, box_top, box_right, box_bottom, image_width, image_height):
+        # Clip a [left, right) x [top, bottom) region to the image; None if nothing is left
+        box_left, box_top = max(box_left, 0), max(box_top, 0)
+        box_right, box_bottom = min(box_right, image_width), min(box_bottom, image_height)
+        if box_left >= box_right or box_top >= box_bottom:
+            return None
+        return box_left, box_top, box_right, box_bottom
+
     @staticmethod
     def draw_bounding_box(draw, box_left, box_top, box_right, box_bottom, bounding_box_rgb, box_background_rgb, line_width):
         # Draw filled background box
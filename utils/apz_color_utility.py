@@ -7,7 +7,10 @@ class ColorUtility:
 
     @staticmethod
     def get_font_color(chunk_styles, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb):
-        if chunk_styles.get('b', False):
+        # A <color=...> tag overrides the node's colors
+        if chunk_styles.get('color') is not None:
+            return chunk_styles.get('color')
+        elif chunk_styles.get('b', False):
             return bold_font_color_rgb
         elif chunk_styles.get('i', False):
             return italic_font_color_rgb
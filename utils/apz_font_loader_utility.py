@@ -1,28 +1,124 @@
 # font_loader_utility.py
 
+from ..utils.apz_instrumentation import shared_instrumentation
 from ..utils.apz_rich_text_parser import parse_rich_text
-from ..utils.apz_text_wrapper import wrap_text
+from ..utils.apz_text_wrapper import wrap_text, wrap_events, count_wrapped_lines, scaled_font_size
 
 class FontLoaderUtility:
-    def __init__(self, font_manager, max_font_size):
+    # Sizes just above the search result that are re-checked, because
+    # hinting and rounding can make the wrap non-monotone in the font size.
+    MONOTONE_CHECK_WINDOW = 2
+
+    def __init__(self, font_manager, max_font_size, use_advance_table=True):
         self.font_manager = font_manager
         self.max_font_size = max_font_size
+        # Seed the search with an estimate from the font's advance table
+        self.use_advance_table = use_advance_table
+        # Number of wrap_text passes run by the last find_fitting_font_size call
+        self.wrap_passes = 0
+
+    def _wrap_at_size(self, parsed_text, font_size, effective_textbox_width, line_height_ratio):
+        # Use regular font as a baseline for size fitting
+        self.wrap_passes += 1
+        shared_instrumentation.count("wrap_passes")
+        loaded_font = self.font_manager.get_regular_font(font_size)
+        line_height = int(font_size * line_height_ratio)
+        scaled_font = lambda scale: self.font_manager.get_regular_font(scaled_font_size(font_size, scale))
+        with shared_instrumentation.stage("wrap"):
+            return wrap_text(parsed_text, loaded_font, effective_textbox_width, line_height, scaled_font)
+
+    def estimate_font_size(self, parsed_text, effective_textbox_width, effective_textbox_height, line_height_ratio):
+        """
+        Largest size that fits when every word is measured with the advance table, found
+        without any FreeType layout. Returns 0 if even size 1 does not fit the estimate.
+        """
+        table = self.font_manager.get_advance_table()
+        events, words = wrap_events(parsed_text)
+        reference_widths = table.measure_words(words + [' '], table.size)
+        word_widths, space_width = reference_widths[:-1], reference_widths[-1]
+
+        def estimate_fits(font_size):
+            scale = font_size / table.size
+            line_count = count_wrapped_lines(events, words, word_widths * scale, space_width * scale, effective_textbox_width)
+            return line_count * int(font_size * line_height_ratio) <= effective_textbox_height
 
-    def find_fitting_font_size(self, theText, effective_textbox_width, effective_textbox_height, line_height_ratio):
-        font_size = self.max_font_size
-        while font_size >= 1:
-            # Use regular font as a baseline for size fitting
-            loaded_font = self.font_manager.get_regular_font(font_size)
-            line_height = int(font_size * line_height_ratio)
+        low, high = 0, self.max_font_size + 1
+        while high - low > 1:
+            middle = (low + high) // 2
+            if estimate_fits(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def find_fitting_font_size(self, theText, effective_textbox_width, effective_textbox_height, line_height_ratio, parsed_text=None):
+        # The "fit" stage includes the "wrap" passes it runs
+        with shared_instrumentation.stage("fit"):
+            return self._find_fitting_font_size(theText, effective_textbox_width, effective_textbox_height, line_height_ratio, parsed_text)
+
+    def _find_fitting_font_size(self, theText, effective_textbox_width, effective_textbox_height, line_height_ratio, parsed_text):
+        # parsed_text can be given when theText was already parsed, e.g. as a template
+        self.wrap_passes = 0
+        if parsed_text is None:
             parsed_text = parse_rich_text(theText)
-            wrapped_lines, total_text_height = wrap_text(parsed_text, loaded_font, effective_textbox_width, line_height)
+        results = {}
+
+        def fits(font_size):
+            if font_size not in results:
+                results[font_size] = self._wrap_at_size(parsed_text, font_size, effective_textbox_width, line_height_ratio)
+            return results[font_size][1] <= effective_textbox_height
+
+        # Largest fitting size: `low` always fits (0 is a sentinel), `high` never does
+        low, high = 0, self.max_font_size + 1
+        guess = self.max_font_size
+        if self.use_advance_table:
+            guess = min(max(self.estimate_font_size(parsed_text, effective_textbox_width, effective_textbox_height, line_height_ratio), 1), self.max_font_size)
+
+        fits_guess = fits(guess)
+        if fits_guess:
+            low = guess
+        else:
+            high = guess
+
+        # Gallop away from an estimated guess until the boundary is bracketed; a good
+        # estimate settles this with exact wraps at the guess and the size above it
+        step = 1
+        while self.use_advance_table and high - low > 1:
+            if fits_guess:
+                probe = min(low + step, high - 1)
+                if not fits(probe):
+                    high = probe
+                    break
+                low = probe
+            else:
+                probe = max(high - step, low + 1)
+                if fits(probe):
+                    low = probe
+                    break
+                high = probe
+            step *= 2
+
+        while high - low > 1:
+            middle = (low + high) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle
+
+        # The linear scan returns the largest fitting size, so look a few sizes above
+        for font_size in range(min(low + self.MONOTONE_CHECK_WINDOW, self.max_font_size), low, -1):
+            if fits(font_size):
+                low = font_size
+                break
+
+        if low < 1:
+            return None, None, None  # Fallback if no fitting size is found
+
+        font_size = low
+        wrapped_lines, total_text_height = results[font_size]
 
-            # Attach font size to the style dictionary in wrapped_lines
-            for line, line_parts in wrapped_lines:
-                for chunk, chunk_styles in line_parts:
-                    chunk_styles['size'] = font_size
+        # Styles are shared and immutable, so the font size goes on copies of them
+        wrapped_lines = [(line, [(chunk, chunk_styles.replace(size=font_size)) for chunk, chunk_styles in line_parts])
+                         for line, line_parts in wrapped_lines]
 
-            if total_text_height <= effective_textbox_height:
-                return font_size, wrapped_lines, total_text_height
-            font_size -= 1
-        return None, None, None  # Fallback if no fitting size is found
\ No newline at end of file
+        return font_size, wrapped_lines, total_text_height
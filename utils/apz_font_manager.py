@@ -1,31 +1,169 @@
 # font_manager.py
-from PIL import ImageFont 
+import logging
+import os
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+from ..utils.apz_advance_table import AdvanceTable
+from ..utils.apz_font_registry import shared_font_registry
+
+logger = logging.getLogger(__name__)
+
+
+class _FontFileBytes:
+    # File-like wrapper handing the same bytes object to every ImageFont.truetype call
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FontCache:
+    """
+    Process-wide LRU cache of loaded fonts keyed by (path, size, file mtime).
+    Each font file is read from disk once and its bytes are shared by all sizes.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._fonts = OrderedDict()
+        self._font_bytes = {}  # path -> (mtime, bytes)
+        self._advance_tables = {}  # (path, mtime) -> AdvanceTable
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.file_reads = 0
+
+    def set_max_entries(self, max_entries):
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def get_font(self, font_path, font_size, mtime=None):
+        if mtime is None:
+            mtime = os.path.getmtime(font_path)
+        key = (font_path, font_size, mtime)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return font
+
+            self.misses += 1
+            logger.debug("Loading font from path: %s with size: %s", font_path, font_size)
+            font = ImageFont.truetype(_FontFileBytes(self._read_font_bytes(font_path, mtime)), font_size)
+            font.path = font_path
+            self._fonts[key] = font
+            self._evict()
+            return font
+
+    def get_advance_table(self, font_path, mtime=None):
+        # Built lazily from the font at the reference size and dropped with the font file bytes
+        if mtime is None:
+            mtime = os.path.getmtime(font_path)
+        key = (font_path, mtime)
+        with self._lock:
+            table = self._advance_tables.get(key)
+        if table is None:
+            table = AdvanceTable(self.get_font(font_path, AdvanceTable.REFERENCE_SIZE, mtime))
+            with self._lock:
+                table = self._advance_tables.setdefault(key, table)
+        return table
+
+    def _read_font_bytes(self, font_path, mtime):
+        cached = self._font_bytes.get(font_path)
+        if cached is None or cached[0] != mtime:
+            with open(font_path, "rb") as font_file:
+                cached = (mtime, font_file.read())
+            self.file_reads += 1
+            self._font_bytes[font_path] = cached
+        return cached[1]
+
+    def _evict(self):
+        while len(self._fonts) > max(self.max_entries, 0):
+            (font_path, _, _), _ = self._fonts.popitem(last=False)
+            if not any(key[0] == font_path for key in self._fonts):
+                self._font_bytes.pop(font_path, None)
+                for table_key in [table_key for table_key in self._advance_tables if table_key[0] == font_path]:
+                    del self._advance_tables[table_key]
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._font_bytes.clear()
+            self._advance_tables.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "file_reads": self.file_reads,
+                "entries": len(self._fonts),
+                "max_entries": self.max_entries,
+            }
+
+
+# Shared by every FontManager so fonts survive between node executions
+shared_font_cache = FontCache(int(os.environ.get("APZ_FONT_CACHE_SIZE", 64)))
+
 
 class FontManager:
-    def __init__(self, regular_font_path, italic_font_path, bold_font_path, max_font_size):
-        self.regular_font_path = regular_font_path
-        self.italic_font_path = italic_font_path
-        self.bold_font_path = bold_font_path
+    def __init__(self, regular_font_path, italic_font_path, bold_font_path, max_font_size, font_cache=None, font_registry=None):
+        # Fonts can be given as paths or as names in the font registry, e.g. "DejaVu Sans:Bold"
+        self.font_registry = font_registry if font_registry is not None else shared_font_registry
+        self.regular_font_path = self.font_registry.resolve_path(regular_font_path)
+        self.italic_font_path = self.font_registry.resolve_path(italic_font_path)
+        self.bold_font_path = self.font_registry.resolve_path(bold_font_path)
         self.max_font_size = max_font_size
 
-        # Print statements to confirm paths
-        print(f"Initialized FontManager with Regular Font: {regular_font_path}")
-        print(f"Italic Font: {italic_font_path}")
-        print(f"Bold Font: {bold_font_path}")
+        logger.debug("Initialized FontManager with Regular Font: %s, Italic Font: %s, Bold Font: %s", self.regular_font_path, self.italic_font_path, self.bold_font_path)
 
-        # Dictionary to cache loaded fonts
-        self.font_cache = {}
+        # Loaded fonts are shared across instances through the process-wide cache
+        self.font_cache = font_cache if font_cache is not None else shared_font_cache
 
-        
+        # Font files are stat'ed once per manager, not once per requested size
+        self.font_mtimes = {}
+
+    def get_font_mtime(self, font_path):
+        mtime = self.font_mtimes.get(font_path)
+        if mtime is None:
+            mtime = os.path.getmtime(font_path)
+            self.font_mtimes[font_path] = mtime
+        return mtime
+
+    def font_signature(self):
+        # (path, mtime) of the three fonts for content-addressed caching; a font that is
+        # missing only fails once a chunk actually needs it
+        signature = []
+        for font_path in (self.regular_font_path, self.italic_font_path, self.bold_font_path):
+            try:
+                signature.append((font_path, self.get_font_mtime(font_path)))
+            except OSError:
+                signature.append((font_path, None))
+        return signature
+
+    @staticmethod
+    def files_signature(font_paths):
+        # Changes whenever one of the font files is edited, replaced or removed
+        signature = []
+        for font_path in font_paths:
+            try:
+                font_path = shared_font_registry.resolve_path(font_path)
+                signature.append(f"{font_path}:{os.path.getmtime(font_path)}")
+            except (OSError, TypeError):
+                signature.append(f"{font_path}:missing")
+        return "|".join(signature)
 
     def load_font(self, font_path, font_size):
-        # Load font from cache if available
-        if (font_path, font_size) not in self.font_cache:
-            print(f"Loading font from path: {font_path} with size: {font_size}")
-            font = ImageFont.truetype(font_path, font_size)
-            self.font_cache[(font_path, font_size)] = font
-        return self.font_cache[(font_path, font_size)]
-    
+        return self.font_cache.get_font(font_path, font_size, self.get_font_mtime(font_path))
+
+
+    def get_advance_table(self):
+        # Fitting measures with the regular font only
+        return self.font_cache.get_advance_table(self.regular_font_path, self.get_font_mtime(self.regular_font_path))
 
     def get_regular_font(self, font_size):
         return self.load_font(self.regular_font_path, font_size)
@@ -0,0 +1,223 @@
+# utils/apz_font_registry.py
+import json
+import logging
+import os
+import sys
+import threading
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+
+def default_font_dirs():
+    # System font directories of the platform, then the user font directories
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        font_dirs = [os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts"),
+                     os.path.join(os.environ.get("LOCALAPPDATA", home), "Microsoft", "Windows", "Fonts")]
+    elif sys.platform == "darwin":
+        font_dirs = ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    else:
+        font_dirs = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(home, ".fonts"), os.path.join(home, ".local", "share", "fonts")]
+    font_dirs.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts"))
+    font_dirs += [font_dir for font_dir in os.environ.get("APZ_FONT_DIRS", "").split(os.pathsep) if font_dir]
+    return font_dirs
+
+
+class FontRegistry:
+    """
+    Index of the fonts in a set of directories by family and style, persisted as JSON so
+    a restart loads it without opening any font file. On load only the directories are
+    stat'ed: a directory whose mtime changed is listed again, and only new or modified
+    font files in it are opened (a file overwritten in place keeps its indexed names
+    until refresh(rescan=True)). Names resolve to paths with one dictionary lookup.
+    """
+
+    INDEX_VERSION = 1
+    FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+    # Ascent and descent are stored at this size, i.e. in thousandths of the font size
+    METRICS_SIZE = 1000
+    # Styles tried, in order, for a name without a style
+    DEFAULT_STYLES = ("regular", "book", "roman", "normal", "medium")
+
+    def __init__(self, font_dirs, index_path=None):
+        self.font_dirs = list(font_dirs)
+        self.index_path = index_path
+        self._fonts = None  # path -> entry, loaded on first use
+        self._directories = {}  # directory -> mtime when it was listed
+        self._names = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name_key(name):
+        return " ".join(name.lower().split())
+
+    @staticmethod
+    def looks_like_path(font):
+        # Paths are used as given; anything else is looked up by name
+        return os.sep in font or (os.altsep or os.sep) in font or font.lower().endswith(FontRegistry.FONT_EXTENSIONS)
+
+    def resolve(self, font):
+        """
+        Returns the path of a font given as a path, "Family:Style", "Family Style" or
+        "Family", or None if no indexed font has that name.
+        """
+        if self.looks_like_path(font):
+            return font
+        self._ensure_loaded()
+        return self._names.get(self._name_key(font))
+
+    def resolve_path(self, font):
+        # Like resolve, but unknown names are kept, so loading them fails like a missing file
+        return self.resolve(font) or font
+
+    def families(self):
+        # {family: [styles]} of every indexed font
+        self._ensure_loaded()
+        families = {}
+        for entry in self._fonts.values():
+            families.setdefault(entry["family"], []).append(entry["style"])
+        return {family: sorted(styles) for family, styles in sorted(families.items())}
+
+    def entry(self, path):
+        # Family, style, mtime and metrics recorded for a font path, or None
+        self._ensure_loaded()
+        return self._fonts.get(path)
+
+    def refresh(self, rescan=False):
+        """
+        Brings the index up to date with the font directories and saves it if anything
+        changed. With rescan, every directory is listed again.
+        """
+        with self._lock:
+            self._refresh(rescan)
+
+    def _ensure_loaded(self):
+        # Checked again under the lock, as another thread may be loading the index
+        if self._fonts is None:
+            with self._lock:
+                if self._fonts is None:
+                    self._refresh(False)
+
+    def _refresh(self, rescan):
+        # Called with the lock held. Readers do not lock, so _fonts is published last,
+        # once the names it is checked for are in place
+        if self._fonts is None:
+            known_fonts, known_directories = self._load_index()
+        else:
+            known_fonts, known_directories = self._fonts, self._directories
+        fonts, directories, changed = self._scan(known_fonts, known_directories, rescan)
+        if changed:
+            self._save_index(fonts, directories)
+        self._names = self._build_names(fonts)
+        self._directories = directories
+        self._fonts = fonts
+
+    def _scan(self, known, known_directories, rescan):
+        # Walks the directories, listing only those that changed; returns the fonts, the
+        # directories and whether the index changed
+        fonts, directories = {}, {}
+        changed = False
+        known_fonts, known_subdirectories = {}, {}
+        for path, entry in known.items():
+            known_fonts.setdefault(os.path.dirname(path), []).append((path, entry))
+        for known_directory in known_directories:
+            known_subdirectories.setdefault(os.path.dirname(known_directory), []).append(known_directory)
+        pending = [os.path.abspath(font_dir) for font_dir in self.font_dirs]
+        while pending:
+            directory = pending.pop()
+            if directory in directories:
+                continue
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue
+            directories[directory] = mtime
+
+            if not rescan and known_directories.get(directory) == mtime:
+                # Unchanged: same files and subdirectories as when it was last listed
+                fonts.update(known_fonts.get(directory, ()))
+                pending += known_subdirectories.get(directory, [])
+                continue
+
+            changed = True
+            try:
+                with os.scandir(directory) as listing:
+                    items = list(listing)
+            except OSError:
+                continue
+            for item in items:
+                if item.is_dir(follow_symlinks=False):
+                    pending.append(item.path)
+                elif item.name.lower().endswith(self.FONT_EXTENSIONS):
+                    try:
+                        mtime = item.stat().st_mtime
+                    except OSError:
+                        continue
+                    entry = known.get(item.path)
+                    if entry is None or entry["mtime"] != mtime:
+                        entry = self._read_font(item.path, mtime)
+                    if entry is not None:
+                        fonts[item.path] = entry
+
+        changed = changed or directories.keys() != known_directories.keys()
+        return fonts, directories, changed
+
+    def _read_font(self, path, mtime):
+        # Opens the font once to record its names and metrics; .ttc files are indexed by their first face
+        try:
+            font = ImageFont.truetype(path, self.METRICS_SIZE)
+        except OSError as e:
+            logger.debug("Skipping unreadable font %s: %s", path, e)
+            return None
+        family, style = font.getname()
+        ascent, descent = font.getmetrics()
+        return {"path": path, "mtime": mtime, "family": family or os.path.splitext(os.path.basename(path))[0],
+                "style": style or "Regular", "ascent": ascent, "descent": descent}
+
+    def _build_names(self, fonts):
+        names = {}
+        family_styles = {}
+        # Sorted so that duplicates of a name always resolve to the same file
+        for path, entry in sorted(fonts.items()):
+            family, style = self._name_key(entry["family"]), self._name_key(entry["style"])
+            names.setdefault(f"{family}:{style}", path)
+            names.setdefault(f"{family} {style}", path)
+            family_styles.setdefault(family, {}).setdefault(style, path)
+        for family, styles in family_styles.items():
+            default_style = next((style for style in self.DEFAULT_STYLES if style in styles), min(styles))
+            names.setdefault(family, styles[default_style])
+        return names
+
+    def _load_index(self):
+        # (fonts, directories) recorded in the index file, empty if there is none
+        if not self.index_path:
+            return {}, {}
+        try:
+            with open(self.index_path, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {}, {}
+        if index.get("version") != self.INDEX_VERSION:
+            return {}, {}
+        return {entry["path"]: entry for entry in index.get("fonts", [])}, index.get("directories", {})
+
+    def _save_index(self, fonts, directories):
+        if not self.index_path:
+            return
+        index = {"version": self.INDEX_VERSION, "directories": directories, "fonts": list(fonts.values())}
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temporary_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as index_file:
+                json.dump(index, index_file)
+            os.replace(temporary_path, self.index_path)
+        except OSError as e:
+            logger.warning("Could not write the font index: %s", e)
+
+
+# Shared by every node; APZ_FONT_INDEX moves the index file, an empty value keeps it in memory only
+shared_font_registry = FontRegistry(
+    default_font_dirs(),
+    os.environ.get("APZ_FONT_INDEX", os.path.join(os.path.expanduser("~"), ".cache", "apz_texttools", "font_index.json")) or None,
+)
@@ -2,46 +2,78 @@ import torch
 import numpy as np
 from PIL import Image
 
-def tensor_to_pil(image_tensor):
+def to_channels_last(image_tensor):
     """
-    Converts a PyTorch tensor with shape [B, H, W, C] or [B, C, H, W] to a list of PIL images.
-    Assumes the tensor contains pixel values in the range [0, 1] for floating-point types
-    and [0, 255] for uint8 types.
+    Returns a [B, H, W, C] view of a tensor with shape [B, H, W, C] or [B, C, H, W].
+    """
+    if image_tensor.shape[1] == 3 or image_tensor.shape[1] == 4:
+        image_tensor = image_tensor.permute(0, 2, 3, 1)
+    return image_tensor
+
+def tensor_to_float(image_tensor, out=None):
     """
-    # Ensure the tensor is on the CPU and in the correct format
+    Returns a new float32 CPU tensor with shape [B, H, W, C] and values in the range [0, 1],
+    safe to modify in place. The values are written into `out` instead when given.
+    """
+    image_tensor = to_channels_last(image_tensor)
+    if out is not None:
+        out.copy_(image_tensor)
+        if not image_tensor.is_floating_point():
+            out.div_(255.0)
+        return out
     if image_tensor.is_floating_point():
-        image_tensor = (image_tensor * 255).type(torch.uint8)
+        return image_tensor.to(device="cpu", dtype=torch.float32, copy=True)
+    return image_tensor.cpu().float() / 255.0
 
-    image_tensor = image_tensor.cpu()  # Ensure the tensor is on the CPU
-    
+def tensor_to_uint8(image_tensor, box=None):
+    """
+    Converts a tensor with shape [B, H, W, C] or [B, C, H, W] to a contiguous uint8 NumPy
+    array with shape [B, H, W, C], using one scale-and-cast for the whole batch.
+    If box (left, top, right, bottom) is given, only that region is converted.
+    """
     # Convert the tensor to [B, H, W, C] format if it's in [B, C, H, W]
-    if image_tensor.shape[1] == 3 or image_tensor.shape[1] == 4:
-        image_tensor = image_tensor.permute(0, 2, 3, 1)
+    image_tensor = to_channels_last(image_tensor)
+    if box is not None:
+        box_left, box_top, box_right, box_bottom = box
+        image_tensor = image_tensor[:, box_top:box_bottom, box_left:box_right]
+    if image_tensor.is_floating_point():
+        image_tensor = (image_tensor * 255).clamp_(0, 255).type(torch.uint8)
+    return image_tensor.cpu().contiguous().numpy()
 
-    pil_images = []
-    for img in image_tensor:
-        img_np = img.numpy()  # Convert to NumPy array
-        print(f"Shape of img_np: {img_np.shape}")  # Print the shape of the NumPy array to the console
-        img_np = img_np.astype(np.uint8)  # Convert to uint8 if necessary
-        pil_image = Image.fromarray(img_np,'RGB')  # Convert to PIL Image
-        pil_images.append(pil_image)
+def _array_to_pil(img_np):
+    height, width, channels = img_np.shape
+    # RGBA and grayscale frames can wrap the batch memory directly
+    if channels == 4:
+        return Image.frombuffer("RGBA", (width, height), img_np, "raw", "RGBA", 0, 1)
+    if channels == 1:
+        return Image.frombuffer("L", (width, height), img_np[:, :, 0], "raw", "L", 0, 1)
+    # PIL stores RGB with a padding byte per pixel, so these frames are copied
+    return Image.fromarray(img_np)
 
-    return pil_images
+def tensor_to_pil(image_tensor, box=None):
+    """
+    Converts a PyTorch tensor with shape [B, H, W, C] or [B, C, H, W] to a list of PIL images.
+    Assumes the tensor contains pixel values in the range [0, 1] for floating-point types
+    and [0, 255] for uint8 types. If box is given, the images only hold that region.
+    """
+    return [_array_to_pil(img_np) for img_np in tensor_to_uint8(image_tensor, box)]
 
-def pil_to_tensor(image_pil):
+def pil_to_tensor(image_pil, out=None):
     """
-    Converts a list of PIL images to a PyTorch tensor with shape [B, C, H, W].
+    Converts a list of PIL images to a PyTorch tensor with shape [B, H, W, C].
     The resulting tensor will contain pixel values in the range [0, 1].
+    Frames are written straight into `out` when given (a CPU float32 tensor of that shape).
     """
     if not isinstance(image_pil, list):
         image_pil = [image_pil]
 
-    tensors = []
-    for img in image_pil:
-        img_np = np.array(img)  # Convert PIL image to NumPy array
-        # img_np = np.expand_dims(img_np, axis=0)
-        print(f"Shape of img_np in pil to tensor: {img_np.shape}")  # Print the shape of the NumPy array to the console
-        tensor = torch.from_numpy(img_np).float() / 255.0  # Convert to tensor and normalize to [0, 1]
-        tensors.append(tensor)
+    if out is None:
+        first = np.asarray(image_pil[0])
+        out = torch.empty((len(image_pil), first.shape[0], first.shape[1], first.shape[2] if first.ndim == 3 else 1), dtype=torch.float32)
 
-    return torch.stack(tensors)  # Stack the list into a batch tensor with shape [B, C, H, W]
+    out_np = out.numpy()
+    for index, img in enumerate(image_pil):
+        img_np = np.asarray(img)
+        np.copyto(out_np[index], img_np if img_np.ndim == 3 else img_np[:, :, None], casting="unsafe")
+    out.div_(255.0)  # Normalize to [0, 1]
+    return out
@@ -0,0 +1,142 @@
+# utils/apz_instrumentation.py
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+# Record of the execution running in the current context; ParallelUtility passes it on to its workers
+_current_record = contextvars.ContextVar("apz_instrumentation_record", default=None)
+
+
+class Instrumentation:
+    """
+    Per-execution stage timings and counters behind one switch, reported through `logging`
+    as one JSON record per node execution. Modes: "off", "on", and "profile", which also
+    runs cProfile over the execution and logs the slowest functions. When off, `stage`
+    and `count` return immediately.
+    """
+
+    # Functions listed from the cProfile run in "profile" mode
+    PROFILE_LINES = 25
+
+    def __init__(self, mode="off"):
+        self._lock = threading.Lock()
+        # Callables receiving every finished record, e.g. to forward it to a tracer
+        self.hooks = []
+        self.configure(mode)
+
+    def configure(self, mode):
+        mode = (mode or "off").strip().lower()
+        if mode in ("1", "true", "yes"):
+            mode = "on"
+        elif mode in ("0", "false", "no", ""):
+            mode = "off"
+        if mode not in ("off", "on", "profile"):
+            raise ValueError(f"Unknown instrumentation mode: {mode!r}")
+        self.mode = mode
+        self.enabled = mode != "off"
+
+    def stage(self, name):
+        """
+        Context manager timing a stage of the current execution. Time spent in worker
+        threads is summed, so a parallel stage can exceed the wall time.
+        """
+        record = _current_record.get() if self.enabled else None
+        if record is None:
+            return _NULL_STAGE
+        return self._timed_stage(record, name)
+
+    @contextlib.contextmanager
+    def _timed_stage(self, record, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stage = record["stages"].setdefault(name, {"ms": 0.0, "calls": 0})
+                stage["ms"] += elapsed * 1000
+                stage["calls"] += 1
+
+    def count(self, name, amount=1):
+        record = _current_record.get() if self.enabled else None
+        if record is None:
+            return
+        with self._lock:
+            counters = record["counters"]
+            counters[name] = counters.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def execution(self, node, **details):
+        """
+        Collects the stages and counters of one node execution and logs them when it ends.
+        The record belongs to the current context, so executions in other threads, or nested
+        ones, keep their own. Cache counters are reported as the change over the execution
+        and count process-wide activity, including that of overlapping executions.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        # Imported here, as modules these import use the instrumentation themselves
+        from ..utils.apz_font_manager import shared_font_cache
+        from ..utils.apz_render_cache import shared_render_cache
+        from ..utils.apz_text_metrics import shared_text_metrics
+
+        def cache_counters():
+            font_stats, render_stats, metric_stats = shared_font_cache.stats(), shared_render_cache.stats(), shared_text_metrics.stats()
+            return {
+                "font_cache_hits": font_stats["hits"],
+                "font_cache_misses": font_stats["misses"],
+                "font_file_reads": font_stats["file_reads"],
+                "glyph_measurements": metric_stats["measurements"],
+                "glyph_measurement_hits": metric_stats["hits"],
+                "render_cache_hits": render_stats["hits"],
+                "render_cache_misses": render_stats["misses"],
+            }
+
+        record = {"event": "apz.execution", "node": node, **details, "stages": {}, "counters": {}}
+        token = _current_record.set(record)
+        before = cache_counters()
+        profiler = None
+        if self.mode == "profile":
+            import cProfile
+            profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_ms"] = (time.perf_counter() - start) * 1000
+            _current_record.reset(token)
+            for name, value in cache_counters().items():
+                record["counters"][name] = value - before[name]
+            self._report(record, profiler)
+
+    def _report(self, record, profiler):
+        for stage in record["stages"].values():
+            stage["ms"] = round(stage["ms"], 3)
+        record["wall_ms"] = round(record["wall_ms"], 3)
+        logger.info(json.dumps(record, sort_keys=True), extra={"apz_record": record})
+        if profiler is not None:
+            import io
+            import pstats
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(self.PROFILE_LINES)
+            logger.info("cProfile of %s:\n%s", record["node"], output.getvalue())
+        for hook in self.hooks:
+            hook(record)
+
+
+# One switch for the whole process: APZ_INSTRUMENTATION=on|profile, or configure() at runtime
+shared_instrumentation = Instrumentation(os.environ.get("APZ_INSTRUMENTATION", "off"))
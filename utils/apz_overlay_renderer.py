@@ -0,0 +1,193 @@
+# utils/apz_overlay_renderer.py
+import torch
+from PIL import ImageDraw
+from ..utils.apz_box_utility import BoxUtility
+from ..utils.apz_color_utility import ColorUtility
+from ..utils.apz_font_loader_utility import FontLoaderUtility
+from ..utils.apz_font_manager import FontManager
+from ..utils.apz_instrumentation import shared_instrumentation
+from ..utils.apz_image_conversion import tensor_to_pil, pil_to_tensor, tensor_to_float, to_channels_last
+from ..utils.apz_parallel_utility import ParallelUtility
+from ..utils.apz_render_cache import shared_render_cache
+from ..utils.apz_text_batch_utility import TextBatchUtility
+from ..utils.apz_text_layer import TextLayerUtility
+from ..utils.apz_text_layout import TextLayoutUtility
+from ..utils.apz_text_renderer_utility import TextRendererUtility
+from ..utils.apz_text_template import TextTemplateUtility
+
+class OverlayRendererUtility:
+    @staticmethod
+    def layout_builder(theTextbox_width, theTextbox_height, max_font_size, font, italic_font, bold_font, alignment, vertical_alignment, font_color, italic_font_color, bold_font_color, box_start_x, box_start_y, padding, line_height_ratio, show_bounding_box, bounding_box_color, line_width, line_opacity, box_background_color, box_opacity, render_cache=shared_render_cache):
+        """
+        Returns a function building the TextLayout of a text with one box's settings.
+        Layouts are memoized in render_cache by a hash of the text and the settings.
+        With reservations, the text is laid out as a template whose placeholders take
+        the reserved text and end up in the layout's slots.
+        """
+        color_utility = ColorUtility()
+
+        font_color_rgb = color_utility.hex_to_rgb(font_color)
+        italic_font_color_rgb = color_utility.hex_to_rgb(italic_font_color)
+        bold_font_color_rgb = color_utility.hex_to_rgb(bold_font_color)
+
+        font_manager = FontManager(font, italic_font, bold_font, max_font_size)
+
+        bounding_box_style = None
+        if show_bounding_box == "true":
+            effective_box_rgb = color_utility.hex_to_rgb(bounding_box_color) + (int(line_opacity * 255),)
+            box_background_rgb = color_utility.hex_to_rgb(box_background_color) + (int(box_opacity * 255),)
+            bounding_box_style = (effective_box_rgb, box_background_rgb, line_width)
+
+        # Everything besides the text that the layout depends on, font file mtimes included
+        settings_key = render_cache.make_key(
+            font_manager.font_signature(), max_font_size, theTextbox_width, theTextbox_height,
+            box_start_x, box_start_y, padding, line_height_ratio, alignment, vertical_alignment,
+            font_color_rgb, italic_font_color_rgb, bold_font_color_rgb, bounding_box_style
+        )
+
+        def build_layout(text, reservations=None):
+            cache_key = render_cache.make_key(settings_key, text, reservations)
+            layout = render_cache.get_layout(cache_key)
+            if layout is None:
+                parsed_text = None
+                if reservations is not None:
+                    parsed_text = TextTemplateUtility.parse_template(text, reservations)
+                # Each layout gets its own FontLoaderUtility; fonts come from the shared cache
+                layout = TextLayoutUtility.build_layout(
+                    text, font_manager, FontLoaderUtility(font_manager, max_font_size), color_utility,
+                    box_start_x, box_start_y, theTextbox_width, theTextbox_height, padding,
+                    line_height_ratio, alignment, vertical_alignment,
+                    font_color_rgb, italic_font_color_rgb, bold_font_color_rgb, bounding_box_style,
+                    parsed_text, reservations
+                )._replace(cache_key=cache_key)
+                render_cache.put_layout(cache_key, layout)
+            return layout
+
+        return build_layout
+
+    @staticmethod
+    def layout_frames(build_layout, frame_texts, workers, start_frame=0, frame_rate=24.0, dynamic_text="reserve"):
+        """
+        Returns the layouts of every frame, one tuple per frame, with each distinct text laid
+        out once. A text with placeholders gets one static layout, its slots reserved for the
+        values of all frames showing it, plus a small layout of each frame's values. With
+        dynamic_text "reflow", every expanded text is laid out on its own instead.
+        """
+        frame_values = [TextTemplateUtility.frame_values(index, start_frame, frame_rate) for index in range(len(frame_texts))]
+        if dynamic_text == "reflow":
+            frame_texts = [TextTemplateUtility.expand(text, values) for text, values in zip(frame_texts, frame_values)]
+        text_frames = TextBatchUtility.group_frames(frame_texts)
+
+        reservations = {}
+        if dynamic_text != "reflow":
+            for text, frames in text_frames.items():
+                if TextTemplateUtility.has_placeholders(text):
+                    reservations[text] = TextTemplateUtility.reservations([frame_values[index] for index in frames])
+
+        # The layout does not depend on the frame, so it is computed once per distinct text
+        layout_workers = ParallelUtility.choose_workers(workers, len(text_frames))
+        texts = list(text_frames)
+        layouts = dict(zip(texts, ParallelUtility.map_items(lambda text: build_layout(text, reservations.get(text)), texts, layout_workers)))
+
+        frame_layouts = []
+        for text, values in zip(frame_texts, frame_values):
+            layout = layouts[text]
+            if layout.slots:
+                frame_layouts.append((layout, TextTemplateUtility.slot_layout(layout, values, dynamic_text)))
+            else:
+                frame_layouts.append((layout,))
+        return frame_layouts
+
+    @staticmethod
+    def render_layer(layouts, render_cache=shared_render_cache):
+        # Layers of layouts with known content hashes are memoized as well
+        if not all(layout.cache_key for layout in layouts):
+            return TextLayerUtility.render_layer(layouts)
+        cache_key = render_cache.make_key(render_cache.LAYER_FORMAT_VERSION, [layout.cache_key for layout in layouts])
+        text_layer = render_cache.get_layer(cache_key)
+        if text_layer is None:
+            text_layer = TextLayerUtility.render_layer(layouts)
+            render_cache.put_layer(cache_key, text_layer)
+        return text_layer
+
+    @staticmethod
+    def render(image, frame_layouts, render_mode, workers, chunk_size=0):
+        """
+        Draws frame_layouts[i] (a tuple of layouts, drawn in order) on frame i of the batch
+        and returns a new [B, H, W, C] float tensor. Every frame goes through the image
+        conversion once, however many layouts it has. Frames are converted, drawn and written
+        into the preallocated output chunk_size frames at a time (0 picks a size from the
+        frame size), so temporaries never hold more than one chunk of the batch.
+        In "device_layer" mode the output stays on the input's device with its floating
+        dtype, and only the rasterized text layers are copied there.
+        """
+        image = to_channels_last(image)
+        frame_count, height, width, channels = image.shape
+        if render_mode == "device_layer":
+            output = torch.empty((frame_count, height, width, channels), device=image.device,
+                                 dtype=image.dtype if image.is_floating_point() else torch.float32)
+        else:
+            output = torch.empty((frame_count, height, width, channels), dtype=torch.float32)
+        chunk_size = ParallelUtility.choose_chunk_size(chunk_size, frame_count, height * width * channels * output.element_size())
+
+        region = None
+        if render_mode == "per_frame_crop":
+            # Only the box region of each frame goes through PIL; the rest is copied as is
+            bounds = TextLayerUtility.layout_bounds(list({id(layout): layout for layouts in frame_layouts for layout in layouts}.values()))
+            if bounds is not None:
+                region = BoxUtility.clip_box_coordinates(*bounds, width, height)
+
+        # Text layers are rasterized once per distinct layout, not once per chunk
+        text_layers = {}
+        for start in range(0, frame_count, chunk_size):
+            end = min(start + chunk_size, frame_count)
+            OverlayRendererUtility._render_chunk(image[start:end], output[start:end], frame_layouts[start:end], render_mode, region, workers, text_layers)
+        return output
+
+    @staticmethod
+    def _render_chunk(image, output, frame_layouts, render_mode, region, workers, text_layers):
+        # Everything converted here is released when the chunk returns
+        if render_mode in ("batch_layer", "device_layer"):
+            # Frames sharing a layout share its rasterized layer, blended into all of them at once;
+            # layouts are blended in the order each frame lists them
+            with shared_instrumentation.stage("convert_in"):
+                tensor_to_float(image, output)
+            for position in range(max(map(len, frame_layouts), default=0)):
+                layout_frames = {}
+                for index, layouts in enumerate(frame_layouts):
+                    if position < len(layouts):
+                        layout_frames.setdefault(id(layouts[position]), (layouts[position], []))[1].append(index)
+                for layout_id, (layout, frames) in layout_frames.items():
+                    if layout_id not in text_layers:
+                        with shared_instrumentation.stage("draw"):
+                            text_layers[layout_id] = TextLayerUtility.layer_to(OverlayRendererUtility.render_layer([layout]), output.device, output.dtype)
+                    with shared_instrumentation.stage("composite"):
+                        TextLayerUtility.composite_layer(output, text_layers[layout_id], frames)
+            return
+
+        if render_mode == "per_frame_crop":
+            with shared_instrumentation.stage("convert_in"):
+                tensor_to_float(image, output)
+                if region is None:
+                    return
+                region_left, region_top, region_right, region_bottom = region
+                pil_images = tensor_to_pil(image, region)
+            target = output[:, region_top:region_bottom, region_left:region_right]
+            offset_x, offset_y = -region_left, -region_top
+        else:
+            with shared_instrumentation.stage("convert_in"):
+                pil_images = tensor_to_pil(image)
+            target = output
+            offset_x, offset_y = 0, 0
+
+        def draw_frame(index):
+            # Each frame gets its own ImageDraw; the layouts and fonts are only read
+            with shared_instrumentation.stage("draw"):
+                draw = ImageDraw.Draw(pil_images[index], "RGBA")
+                for layout in frame_layouts[index]:
+                    TextRendererUtility.draw_layout(draw, layout, offset_x, offset_y)
+            with shared_instrumentation.stage("convert_out"):
+                pil_to_tensor([pil_images[index]], target[index:index + 1])
+
+        frame_workers = ParallelUtility.choose_workers(workers, len(pil_images), target.shape[1] * target.shape[2])
+        ParallelUtility.map_frames(draw_frame, len(pil_images), frame_workers)
@@ -0,0 +1,55 @@
+# utils/apz_parallel_utility.py
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+class ParallelUtility:
+    # Below this much work per thread, pool start-up costs more than it saves
+    MIN_PIXELS_PER_WORKER = 1_000_000
+    # Budget for the float copy of the frames handled at once when chunk_size is 0
+    MAX_CHUNK_BYTES = 256 * 1024 * 1024
+
+    @staticmethod
+    def choose_workers(requested_workers, batch_size, frame_area=None):
+        # requested_workers > 0 is used as given; 0 picks a count from the batch size and frame area
+        if requested_workers > 0:
+            return max(1, min(requested_workers, batch_size))
+        if batch_size < 2:
+            return 1
+        if frame_area is None:
+            return min(os.cpu_count() or 1, batch_size)
+        by_work = batch_size * frame_area // ParallelUtility.MIN_PIXELS_PER_WORKER
+        return max(1, min(os.cpu_count() or 1, batch_size, by_work))
+
+    @staticmethod
+    def choose_chunk_size(requested_chunk_size, batch_size, frame_bytes):
+        # requested_chunk_size > 0 is used as given; 0 fits as many frames as MAX_CHUNK_BYTES allows
+        if requested_chunk_size > 0:
+            return max(1, min(requested_chunk_size, batch_size))
+        return max(1, min(batch_size, ParallelUtility.MAX_CHUNK_BYTES // max(frame_bytes, 1)))
+
+    @staticmethod
+    def map_frames(function, frame_count, workers):
+        # Calls function(index) for every frame; each call writes its own output slot,
+        # so the result does not depend on the order the threads run in
+        if workers <= 1:
+            for index in range(frame_count):
+                function(index)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(ParallelUtility._in_context(function), range(frame_count)):
+                pass
+
+    @staticmethod
+    def map_items(function, items, workers):
+        # Like map(), with the results in the order of items
+        if workers <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(ParallelUtility._in_context(function), items))
+
+    @staticmethod
+    def _in_context(function):
+        # Runs every call in a copy of the caller's context, so workers report to the caller's instrumentation record
+        context = contextvars.copy_context()
+        return lambda item: context.copy().run(function, item)
@@ -0,0 +1,139 @@
+# utils/apz_render_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import torch
+from ..utils.apz_text_layer import TextLayer
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """
+    Content-addressed LRU cache of text layouts and rasterized text layers, bounded by an
+    approximate memory budget. Layers can also be kept in an on-disk directory, which
+    survives restarts; layouts hold font objects and only live in memory.
+    """
+
+    # Part of every layer key, so layers written to disk by older code are not reused. Bump it
+    # whenever the same text and settings render differently (2: <color> and <size> tags)
+    LAYER_FORMAT_VERSION = 2
+
+    # Rough memory cost of a layout: a fixed part plus one per positioned chunk
+    LAYOUT_BASE_BYTES = 1024
+    LAYOUT_CHUNK_BYTES = 256
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()  # key -> (value, size in bytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(*parts):
+        # Stable hash of JSON-serializable parts
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_layout(self, key):
+        return self._get(("layout", key))
+
+    def put_layout(self, key, layout):
+        size = self.LAYOUT_BASE_BYTES + self.LAYOUT_CHUNK_BYTES * len(layout.chunks)
+        self._put(("layout", key), layout, size)
+
+    def get_layer(self, key):
+        layer = self._get(("layer", key))
+        if layer is None and self.disk_dir:
+            layer = self._load_layer(key)
+            if layer is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put(("layer", key), layer, self._layer_bytes(layer))
+        return layer
+
+    def put_layer(self, key, layer):
+        if layer is None:
+            return  # Nothing to draw; recomputing that is free
+        self._put(("layer", key), layer, self._layer_bytes(layer))
+        if self.disk_dir:
+            self._save_layer(key, layer)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, size):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            if size > self.max_bytes:
+                return  # Larger than the whole budget, not worth keeping
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    @staticmethod
+    def _layer_bytes(layer):
+        return layer.color.element_size() * layer.color.nelement() + layer.alpha.element_size() * layer.alpha.nelement()
+
+    def _layer_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _save_layer(self, key, layer):
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            temporary_path = self._layer_path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "wb") as layer_file:
+                np.savez(layer_file, origin=np.array([layer.left, layer.top]), color=layer.color.numpy(), alpha=layer.alpha.numpy())
+            os.replace(temporary_path, self._layer_path(key))
+        except OSError as e:
+            logger.warning("Could not write text layer to the render cache: %s", e)
+
+    def _load_layer(self, key):
+        try:
+            with np.load(self._layer_path(key)) as data:
+                left, top = (int(value) for value in data["origin"])
+                return TextLayer(left, top, torch.from_numpy(data["color"]), torch.from_numpy(data["alpha"]))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared by every node execution; the disk tier is off unless a directory is configured
+shared_render_cache = RenderCache(
+    int(float(os.environ.get("APZ_RENDER_CACHE_MB", 256)) * 1024 * 1024),
+    os.environ.get("APZ_RENDER_CACHE_DIR") or None,
+)
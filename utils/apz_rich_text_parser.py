@@ -1,33 +1,166 @@
 # rich_text_parser.py
+import functools
 import re
+import threading
+import weakref
 
-def parse_rich_text(theText):
-    tag_re = re.compile(r'<(/?)(b|i|u|s)>')
+# <b>, <i>, <u> and <s> switch a style on; <color=...> and <size=...> take a value, quoted or not.
+# A closing tag restores the style from before the most recent opening tag. Tags with an
+# invalid value, such as <color=red>, are drawn as text like unknown tags.
+TAG_RE = re.compile(r'<(?:/(b|i|u|s|color|size)|(b|i|u|s)|(color|size)=("?)([^">]+)\4)>')
+
+# Distinct texts whose parse results are kept
+PARSE_CACHE_SIZE = 1024
+
+
+class TextStyle:
+    """
+    Immutable style of a text run. Instances are interned while in use, so equal styles
+    are the same object and parsed runs can be shared between threads and cached results. Read like
+    the style dicts of earlier versions: style.get('b'), style['size'].
+
+    color is an (r, g, b) tuple overriding the node's colors, scale multiplies the fitted
+    font size, slot names a template placeholder, and size is the fitted font size the
+    fitter attaches to wrapped runs.
+    """
+
+    FIELDS = ("b", "i", "u", "s", "color", "scale", "slot", "size")
+    __slots__ = FIELDS + ("__weakref__",)
+
+    # Weak, so styles no longer referenced by a run or a cached parse are released
+    _interned = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __new__(cls, b=False, i=False, u=False, s=False, color=None, scale=None, slot=None, size=None):
+        key = (b, i, u, s, color, scale, slot, size)
+        style = cls._interned.get(key)
+        if style is None:
+            with cls._lock:
+                style = cls._interned.get(key)
+                if style is None:
+                    style = object.__new__(cls)
+                    for name, value in zip(cls.FIELDS, key):
+                        object.__setattr__(style, name, value)
+                    cls._interned[key] = style
+        return style
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TextStyle is immutable; use replace()")
+
+    def __reduce__(self):
+        return TextStyle, self._values()
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def replace(self, **changes):
+        values = dict(zip(self.FIELDS, self._values()))
+        values.update(changes)
+        return TextStyle(**values)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None) if name in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        if name not in self.FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={value!r}" for name, value in zip(self.FIELDS, self._values()) if value not in (None, False))
+        return f"TextStyle({values})"
+
+
+PLAIN_STYLE = TextStyle()
+
+
+def _parse_color(value):
+    # #RGB or #RRGGBB, or None if the value is neither
+    value = value.strip()
+    if not value.startswith('#'):
+        return None
+    digits = value[1:]
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    if len(digits) != 6 or any(digit not in '0123456789abcdefABCDEF' for digit in digits):
+        return None
+    return tuple(int(digits[i:i+2], 16) for i in (0, 2, 4))
+
+
+def _parse_scale(value):
+    # "1.5" or "150%", relative to the fitted font size, or None if the value is invalid
+    text = value.strip()
+    try:
+        scale = float(text[:-1]) / 100 if text.endswith('%') else float(text)
+    except ValueError:
+        return None
+    return scale if 0 < scale <= 10 else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _apply_tag(style, flag, name, value):
+    # Style inside an opening tag, or None if its value is invalid; memoized, so repeated tags cost one lookup
+    if flag:
+        return style.replace(**{flag: True})
+    if name == 'color':
+        color = _parse_color(value)
+        return None if color is None else style.replace(color=color)
+    scale = _parse_scale(value)
+    if scale is None:
+        return None
+    # Nested sizes multiply; 1 is stored as None so it matches the plain style
+    scale = round((style.scale or 1) * scale, 6)
+    return style.replace(scale=None if scale == 1 else scale)
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(theText):
     parts = []
     current_pos = 0
-    styles = {'b': False, 'i': False, 'u': False, 's': False}
+    style = PLAIN_STYLE
     style_stack = []
-
-    for match in tag_re.finditer(theText):
+    open_tags = []
+    # Closing tags left as text because their opening tag had an invalid value
+    literal_closings = {}
+    for match in TAG_RE.finditer(theText):
+        closing, flag, name, _, value = match.groups()
+        if closing:
+            if literal_closings and literal_closings.get(closing) and closing not in open_tags:
+                literal_closings[closing] -= 1
+                continue
+            new_style = None
+        else:
+            new_style = _apply_tag(style, flag, name, value)
+            if new_style is None:
+                literal_closings[name] = literal_closings.get(name, 0) + 1
+                continue
         start, end = match.span()
-        tag_type, tag_name = match.groups()
-
         if start > current_pos:
-            parts.append((theText[current_pos:start], styles.copy()))
-
-        if tag_type == '':
-            style_stack.append(styles.copy())
-            styles[tag_name] = True
-        else:
+            parts.append((theText[current_pos:start], style))
+        if closing:
             if style_stack:
-                styles = style_stack.pop()
-
+                style = style_stack.pop()
+                open_tags.pop()
+        else:
+            style_stack.append(style)
+            open_tags.append(flag or name)
+            style = new_style
         current_pos = end
-
     if current_pos < len(theText):
-        parts.append((theText[current_pos:], styles.copy()))
-
+        parts.append((theText[current_pos:], style))
     if not parts:
-        parts.append((theText, styles.copy()))
+        parts.append((theText, style))
+    return tuple(parts)
+
+
+def parse_rich_text(theText):
+    """
+    Splits theText into (text, TextStyle) runs in one pass over its tags. Results are
+    cached by text, so parsing the same caption again is a lookup.
+    """
+    return list(_parse(theText))
+
 
-    return parts
+def clear_parse_cache():
+    _parse.cache_clear()
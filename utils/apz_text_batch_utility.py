@@ -0,0 +1,29 @@
+# utils/apz_text_batch_utility.py
+import json
+
+class TextBatchUtility:
+    @staticmethod
+    def split_texts(theText, text_batch_mode):
+        # "single": one text for every frame, "lines": one line per frame, "json": a JSON list of strings
+        if text_batch_mode == "lines":
+            # splitlines handles CRLF pastes and ignores the newline that ends the last line
+            return theText.splitlines() or [""]
+        if text_batch_mode == "json":
+            texts = json.loads(theText)
+            if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+                raise ValueError("theText must be a non-empty JSON list of strings when text_batch_mode is 'json'")
+            return texts
+        return [theText]
+
+    @staticmethod
+    def assign_frame_texts(texts, batch_size):
+        # Frame i gets texts[i]; when there are fewer texts than frames the last one is held
+        return [texts[min(index, len(texts) - 1)] for index in range(batch_size)]
+
+    @staticmethod
+    def group_frames(frame_texts):
+        # Maps each distinct text, in first-seen order, to the frames that show it
+        groups = {}
+        for index, text in enumerate(frame_texts):
+            groups.setdefault(text, []).append(index)
+        return groups
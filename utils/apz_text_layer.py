@@ -0,0 +1,116 @@
+# utils/apz_text_layer.py
+from typing import NamedTuple
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+from ..utils.apz_box_utility import BoxUtility
+from ..utils.apz_text_metrics import shared_text_metrics
+from ..utils.apz_text_renderer_utility import TextRendererUtility
+
+
+class TextLayer(NamedTuple):
+    """
+    Premultiplied RGBA raster of one or more layouts, covering only their bounds
+    in image coordinates. Compositing is `image * (1 - alpha) + color`.
+    """
+    left: int
+    top: int
+    color: torch.Tensor  # [h, w, 3] float32, premultiplied by alpha
+    alpha: torch.Tensor  # [h, w, 1] float32
+
+
+class TextLayerUtility:
+    # Extra pixels around the measured bounds to absorb antialiasing and rounding
+    BOUNDS_MARGIN = 2
+
+    @staticmethod
+    def layout_bounds(layouts):
+        """
+        Returns (left, top, right, bottom) covering the bounding boxes and the text
+        ink of all layouts, or None if there is nothing to draw.
+        """
+        bounds = []
+        for layout in layouts:
+            if layout.bounding_box is not None:
+                box_left, box_top, box_right, box_bottom = layout.bounding_box[:4]
+                bounds.append((box_left, box_top, box_right + 1, box_bottom + 1))
+            for chunk in layout.chunks:
+                ink_left, ink_top, ink_right, ink_bottom = shared_text_metrics.measure(chunk.font, chunk.text).bbox
+                bounds.append((chunk.x + ink_left, chunk.y + ink_top, chunk.x + ink_right, chunk.y + ink_bottom))
+                for line_y in (chunk.underline_y, chunk.strikeout_y):
+                    if line_y is not None:
+                        bounds.append((chunk.x, line_y, chunk.x + chunk.width + 1, line_y + 1))
+        if not bounds:
+            return None
+
+        margin = TextLayerUtility.BOUNDS_MARGIN
+        return (int(min(bound[0] for bound in bounds)) - margin, int(min(bound[1] for bound in bounds)) - margin,
+                int(max(bound[2] for bound in bounds)) + margin, int(max(bound[3] for bound in bounds)) + margin)
+
+    @staticmethod
+    def render_layer(layouts):
+        """
+        Rasterizes the layouts once into a TextLayer, or returns None if there is nothing to draw.
+        The layouts are drawn over black and over white with the same PIL calls the per-frame
+        path uses; the two results give the premultiplied color and the coverage.
+        """
+        bounds = TextLayerUtility.layout_bounds(layouts)
+        if bounds is None:
+            return None
+        left, top, right, bottom = bounds
+
+        rasters = []
+        for background in (0, 255):
+            base = Image.new("RGB", (right - left, bottom - top), (background,) * 3)
+            draw = ImageDraw.Draw(base, "RGBA")
+            for layout in layouts:
+                TextRendererUtility.draw_layout(draw, layout, -left, -top)
+            rasters.append(np.asarray(base, dtype=np.float32) / 255.0)
+        on_black, on_white = rasters
+
+        alpha = np.clip(1.0 - (on_white - on_black).mean(axis=2, keepdims=True), 0.0, 1.0)
+        return TextLayer(left, top, torch.from_numpy(on_black), torch.from_numpy(alpha))
+
+    @staticmethod
+    def layer_to(layer, device, dtype):
+        # The layer on the device and with the dtype of the images it is blended into
+        if layer is None or (layer.color.device == torch.device(device) and layer.color.dtype == dtype):
+            return layer
+        return layer._replace(color=layer.color.to(device=device, dtype=dtype), alpha=layer.alpha.to(device=device, dtype=dtype))
+
+    @staticmethod
+    def composite_layer(images, layer, frames=None):
+        """
+        Alpha-blends the layer into the frames of a [B, H, W, C] float tensor in place
+        (every frame, or only the given frame indices). The layer is clipped to the image;
+        frames are blended in one vectorized operation. The layer has to be on the device
+        and in the dtype of the images, see layer_to.
+        """
+        if layer is None:
+            return images
+        height, width = images.shape[1:3]
+        layer_height, layer_width = layer.alpha.shape[:2]
+
+        region = BoxUtility.clip_box_coordinates(layer.left, layer.top, layer.left + layer_width, layer.top + layer_height, width, height)
+        if region is None:
+            return images
+        left, top, right, bottom = region
+
+        layer_rows = slice(top - layer.top, bottom - layer.top)
+        layer_columns = slice(left - layer.left, right - layer.left)
+        alpha = layer.alpha[layer_rows, layer_columns]
+        color = layer.color[layer_rows, layer_columns]
+
+        if frames is None:
+            frames = slice(None)
+        elif list(frames) == list(range(frames[0], frames[-1] + 1)):
+            # A run of consecutive frames can still be blended through a view
+            frames = slice(frames[0], frames[-1] + 1)
+        if isinstance(frames, slice):
+            region = images[frames, top:bottom, left:right, :3]
+            region.mul_(1.0 - alpha).add_(color)
+        else:
+            frames = torch.as_tensor(frames, dtype=torch.long, device=images.device)
+            region = images[frames, top:bottom, left:right, :3]
+            images[frames, top:bottom, left:right, :3] = region.mul_(1.0 - alpha).add_(color)
+        return images
@@ -0,0 +1,147 @@
+# utils/apz_text_layout.py
+from typing import NamedTuple, Optional, Tuple
+from ..utils.apz_box_utility import BoxUtility
+from ..utils.apz_instrumentation import shared_instrumentation
+from ..utils.apz_text_metrics import shared_text_metrics
+from ..utils.apz_text_wrapper import line_heights, scaled_font_size
+
+
+class LayoutChunk(NamedTuple):
+    text: str
+    x: int
+    y: int
+    font: object
+    fill: Tuple[int, ...]
+    width: int
+    underline_y: Optional[int] = None
+    strikeout_y: Optional[int] = None
+    # Placeholder name of a template slot, whose text changes per frame
+    slot: Optional[str] = None
+
+
+class TextLayout(NamedTuple):
+    """
+    Frame-independent result of fitting, wrapping and positioning a text in its box.
+    Built once per node execution and drawn on every frame of the batch.
+    """
+    font_size: Optional[int]
+    lines: Tuple[str, ...]
+    total_text_height: Optional[int]
+    chunks: Tuple[LayoutChunk, ...]
+    box: Tuple[int, int, int, int]
+    # Arguments for BoxUtility.draw_bounding_box after `draw`, or None when hidden
+    bounding_box: Optional[tuple] = None
+    # Content hash of the text and settings this layout was built from, if known
+    cache_key: Optional[str] = None
+    # Template slots: chunks holding the reserved text, drawn per frame instead of with `chunks`
+    slots: Tuple[LayoutChunk, ...] = ()
+    reservations: Optional[dict] = None
+
+
+class TextLayoutUtility:
+    @staticmethod
+    def layout_text(wrapped_lines, box_start_x, box_start_y, padding, theTextbox_width, theTextbox_height, font_manager, color_utility, alignment, vertical_alignment, line_height_ratio, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb):
+        # The fitter attaches the font size to every chunk style; the first line may be empty
+        font_size = next((chunk_styles['size'] for line, line_parts in wrapped_lines for chunk, chunk_styles in line_parts), None)
+        if font_size is None:
+            return ()  # If there's no text to render
+
+        # Calculate effective dimensions
+        effective_textbox_width, effective_textbox_height = BoxUtility.calculate_effective_dimensions(theTextbox_width, theTextbox_height, padding)
+
+        # Calculate total text height for vertical alignment purposes; <size> runs make their lines taller
+        line_height = int(font_size * line_height_ratio)
+        scaled = any(chunk_styles.get('scale') for line, line_parts in wrapped_lines for chunk, chunk_styles in line_parts)
+        heights = line_heights(wrapped_lines, line_height) if scaled else [line_height] * len(wrapped_lines)
+        total_text_height = sum(heights)
+
+        # Calculate the initial Y position based on vertical alignment
+        if vertical_alignment == "top":
+            current_y = box_start_y + padding
+        elif vertical_alignment == "middle":
+            current_y = box_start_y + padding + (effective_textbox_height - total_text_height) // 2
+        elif vertical_alignment == "bottom":
+            current_y = box_start_y + padding + (effective_textbox_height - total_text_height)
+
+        # Fonts are resolved once per style and every chunk is measured once
+        style_fonts = {}
+        chunks = []
+        for (line, line_parts), height in zip(wrapped_lines, heights):
+            measured_parts = []
+            for chunk, chunk_styles in line_parts:
+                scale = chunk_styles.get('scale')
+                style_key = (bool(chunk_styles.get('b', False)), bool(chunk_styles.get('i', False)), scale)
+                current_font = style_fonts.get(style_key)
+                if current_font is None:
+                    current_font = style_fonts[style_key] = font_manager.get_font_for_style(chunk_styles, scaled_font_size(font_size, scale) if scale else font_size)
+                measured_parts.append((chunk, chunk_styles, current_font, shared_text_metrics.measure(current_font, chunk)))
+
+            # Runs of different sizes share the baseline of the line's largest font
+            baseline = None
+            if scaled and len({chunk_styles.get('scale') for chunk, chunk_styles in line_parts}) > 1:
+                baseline = max(current_font.getmetrics()[0] for chunk, chunk_styles, current_font, metrics in measured_parts)
+
+            # Calculate the total width of the line
+            line_width = sum(metrics.bbox[2] for chunk, chunk_styles, current_font, metrics in measured_parts)
+
+            # Adjust the X position based on alignment
+            if alignment == "left":
+                current_x = box_start_x + padding
+            elif alignment == "center":
+                current_x = box_start_x + padding + (effective_textbox_width - line_width) // 2
+            elif alignment == "right":
+                current_x = box_start_x + padding + (effective_textbox_width - line_width)
+
+            for chunk, chunk_styles, current_font, metrics in measured_parts:
+                chunk_y = current_y if baseline is None else current_y + baseline - current_font.getmetrics()[0]
+                current_font_color_rgb = color_utility.get_font_color(chunk_styles, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb)
+                chunk_width = metrics.bbox[2] - metrics.bbox[0]
+
+                # The bottom of the run's bbox, what the removed FreeTypeFont.getsize() reported as height
+                underline_y = strikeout_y = None
+                if chunk_styles.get('u', False):  # Underline
+                    underline_y = chunk_y + metrics.bbox[3]
+                if chunk_styles.get('s', False):  # Strikethrough
+                    strikeout_y = chunk_y + metrics.bbox[3] // 2
+
+                chunks.append(LayoutChunk(chunk, current_x, chunk_y, current_font, current_font_color_rgb, chunk_width, underline_y, strikeout_y, chunk_styles.get('slot')))
+                current_x += chunk_width
+
+            # Move to the next line
+            current_y += height
+
+        return tuple(chunks)
+
+    @staticmethod
+    def build_layout(theText, font_manager, font_loader, color_utility, box_start_x, box_start_y, theTextbox_width, theTextbox_height, padding, line_height_ratio, alignment, vertical_alignment, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb, bounding_box_style=None, parsed_text=None, reservations=None):
+        # Calculate box coordinates
+        box = BoxUtility.calculate_box_coordinates(box_start_x, box_start_y, theTextbox_width, theTextbox_height)
+        box_left, box_top, box_right, box_bottom = box
+
+        bounding_box = None
+        if bounding_box_style is not None:
+            # Calculate the effective box coordinates considering padding
+            bounding_box_rgba, box_background_rgba, line_width = bounding_box_style
+            bounding_box = BoxUtility.calculate_effective_box_coordinates(box_start_x, box_start_y, theTextbox_width, theTextbox_height, padding) + (bounding_box_rgba, box_background_rgba, line_width)
+
+        # Find the font size and wrap the lines
+        font_size, wrapped_lines, total_text_height = font_loader.find_fitting_font_size(theText, theTextbox_width - 2 * padding, theTextbox_height - 2 * padding, line_height_ratio, parsed_text)
+
+        chunks = ()
+        lines = ()
+        if font_size:
+            lines = tuple(line for line, line_parts in wrapped_lines)
+            with shared_instrumentation.stage("layout"):
+                chunks = TextLayoutUtility.layout_text(
+                    wrapped_lines, box_left, box_top, padding,
+                    box_right - box_left, box_bottom - box_top, font_manager,
+                    color_utility, alignment, vertical_alignment, line_height_ratio,
+                    font_color_rgb, italic_font_color_rgb, bold_font_color_rgb
+                )
+
+        # Template slots are positioned with the rest of the text but drawn separately
+        slots = tuple(chunk for chunk in chunks if chunk.slot is not None)
+        if slots:
+            chunks = tuple(chunk for chunk in chunks if chunk.slot is None)
+
+        return TextLayout(font_size, lines, total_text_height, chunks, box, bounding_box, slots=slots, reservations=reservations)
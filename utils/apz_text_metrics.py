@@ -0,0 +1,98 @@
+# utils/apz_text_metrics.py
+import threading
+import weakref
+from typing import NamedTuple, Tuple
+
+
+class RunMetrics(NamedTuple):
+    advance: float
+    bbox: Tuple[int, int, int, int]
+    ascent: int
+    descent: int
+
+
+class TextMetricsCache:
+    """
+    Measurements of text runs, shared by the wrapper, the fitter and the renderer.
+    Entries are keyed by font object (one per path, size and mtime through the font
+    cache) and run text, so they carry over between node executions.
+    """
+
+    # Runs kept per font before its table is dropped and refilled
+    MAX_RUNS_PER_FONT = 20000
+
+    def __init__(self):
+        self._fonts = weakref.WeakKeyDictionary()  # font -> ({text: RunMetrics}, {(char, char): kerning}, (ascent, descent))
+        self._lock = threading.Lock()
+        # [hits, measurements] per thread, so workers count without contending for the lock
+        self._local = threading.local()
+        self._thread_counts = {}  # thread ident -> counts of the last thread with that ident
+        self._finished_counts = [0, 0]  # counts of threads whose ident was reused
+
+    def _font_entry(self, font):
+        entry = self._fonts.get(font)
+        if entry is None:
+            with self._lock:
+                entry = self._fonts.get(font)
+                if entry is None:
+                    entry = ({}, {}, font.getmetrics())
+                    self._fonts[font] = entry
+        return entry
+
+    def _counts(self):
+        try:
+            return self._local.counts
+        except AttributeError:
+            counts = self._local.counts = [0, 0]
+            with self._lock:
+                # An ident is only reused once its thread has ended, so those counts are final
+                previous = self._thread_counts.get(threading.get_ident())
+                if previous is not None:
+                    self._finished_counts = [total + count for total, count in zip(self._finished_counts, previous)]
+                self._thread_counts[threading.get_ident()] = counts
+            return counts
+
+    @property
+    def hits(self):
+        with self._lock:
+            return self._finished_counts[0] + sum(counts[0] for counts in self._thread_counts.values())
+
+    @property
+    def measurements(self):
+        with self._lock:
+            return self._finished_counts[1] + sum(counts[1] for counts in self._thread_counts.values())
+
+    def measure(self, font, text):
+        runs, _, (ascent, descent) = self._font_entry(font)
+        metrics = runs.get(text)
+        if metrics is None:
+            if len(runs) >= self.MAX_RUNS_PER_FONT:
+                runs.clear()
+            metrics = RunMetrics(font.getlength(text), font.getbbox(text), ascent, descent)
+            runs[text] = metrics
+            self._counts()[1] += 1
+        else:
+            self._counts()[0] += 1
+        return metrics
+
+    def kerning(self, font, left_char, right_char):
+        # Advance correction between two adjacent characters
+        _, pairs, _ = self._font_entry(font)
+        pair = (left_char, right_char)
+        kerning = pairs.get(pair)
+        if kerning is None:
+            kerning = (self.measure(font, left_char + right_char).advance
+                       - self.measure(font, left_char).advance
+                       - self.measure(font, right_char).advance)
+            pairs[pair] = kerning
+        return kerning
+
+    def clear(self):
+        with self._lock:
+            self._fonts = weakref.WeakKeyDictionary()
+
+    def stats(self):
+        return {"hits": self.hits, "measurements": self.measurements, "fonts": len(self._fonts)}
+
+
+shared_text_metrics = TextMetricsCache()
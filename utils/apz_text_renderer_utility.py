@@ -1,52 +1,33 @@
 # utils/apz_text_renderer_utility.py
 from ..utils.apz_box_utility import BoxUtility
+from ..utils.apz_text_layout import TextLayoutUtility
 
 class TextRendererUtility:
     @staticmethod
-    def render_text(draw, wrapped_lines, box_start_x, box_start_y, padding, theTextbox_width, theTextbox_height, font_manager, color_utility, alignment, vertical_alignment, line_height_ratio, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb):
-        if not wrapped_lines:
-            return  # If there's no text to render
-
-        # Calculate effective dimensions
-        effective_textbox_width, effective_textbox_height = BoxUtility.calculate_effective_dimensions(theTextbox_width, theTextbox_height, padding)
-
-        # Calculate total text height for vertical alignment purposes
-        total_text_height = len(wrapped_lines) * int(wrapped_lines[0][1][0][1]['size'] * line_height_ratio)
-
-        # Calculate the initial Y position based on vertical alignment
-        if vertical_alignment == "top":
-            current_y = box_start_y + padding
-        elif vertical_alignment == "middle":
-            current_y = box_start_y + padding + (effective_textbox_height - total_text_height) // 2
-        elif vertical_alignment == "bottom":
-            current_y = box_start_y + padding + (effective_textbox_height - total_text_height)
-
-        for line, line_parts in wrapped_lines:
-            # Calculate the total width of the line
-            line_width = sum(font_manager.get_font_for_style(chunk_styles, wrapped_lines[0][1][0][1]['size']).getbbox(chunk)[2] for chunk, chunk_styles in line_parts)
-
-            # Adjust the X position based on alignment
-            if alignment == "left":
-                current_x = box_start_x + padding
-            elif alignment == "center":
-                current_x = box_start_x + padding + (effective_textbox_width - line_width) // 2
-            elif alignment == "right":
-                current_x = box_start_x + padding + (effective_textbox_width - line_width)
+    def draw_chunks(draw, chunks, offset_x=0, offset_y=0):
+        for chunk in chunks:
+            x, y = chunk.x + offset_x, chunk.y + offset_y
+            draw.text((x, y), chunk.text, fill=chunk.fill, font=chunk.font)
+            if chunk.underline_y is not None:
+                underline_y = chunk.underline_y + offset_y
+                draw.line((x, underline_y, x + chunk.width, underline_y), fill=chunk.fill, width=1)
+            if chunk.strikeout_y is not None:
+                strikeout_y = chunk.strikeout_y + offset_y
+                draw.line((x, strikeout_y, x + chunk.width, strikeout_y), fill=chunk.fill, width=1)
 
-            for chunk, chunk_styles in line_parts:
-                current_font = font_manager.get_font_for_style(chunk_styles, wrapped_lines[0][1][0][1]['size'])
-                current_font_color_rgb = color_utility.get_font_color(chunk_styles, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb)
-                draw.text((current_x, current_y), chunk, fill=current_font_color_rgb, font=current_font)
-                chunk_width = current_font.getbbox(chunk)[2] - current_font.getbbox(chunk)[0]
-
-                if chunk_styles.get('u', False):  # Underline
-                    underline_y = current_y + current_font.getsize(chunk)[1]
-                    draw.line((current_x, underline_y, current_x + chunk_width, underline_y), fill=current_font_color_rgb, width=1)
-                if chunk_styles.get('s', False):  # Strikethrough
-                    strikeout_y = current_y + current_font.getsize(chunk)[1] // 2
-                    draw.line((current_x, strikeout_y, current_x + chunk_width, strikeout_y), fill=current_font_color_rgb, width=1)
-
-                current_x += chunk_width
+    @staticmethod
+    def draw_layout(draw, layout, offset_x=0, offset_y=0):
+        # Draw the bounding box first so the text ends up on top of it
+        if layout.bounding_box is not None:
+            box_left, box_top, box_right, box_bottom = layout.bounding_box[:4]
+            BoxUtility.draw_bounding_box(draw, box_left + offset_x, box_top + offset_y, box_right + offset_x, box_bottom + offset_y, *layout.bounding_box[4:])
+        TextRendererUtility.draw_chunks(draw, layout.chunks, offset_x, offset_y)
 
-            # Move to the next line
-            current_y += int(wrapped_lines[0][1][0][1]['size'] * line_height_ratio)
+    @staticmethod
+    def render_text(draw, wrapped_lines, box_start_x, box_start_y, padding, theTextbox_width, theTextbox_height, font_manager, color_utility, alignment, vertical_alignment, line_height_ratio, font_color_rgb, italic_font_color_rgb, bold_font_color_rgb):
+        chunks = TextLayoutUtility.layout_text(
+            wrapped_lines, box_start_x, box_start_y, padding, theTextbox_width, theTextbox_height,
+            font_manager, color_utility, alignment, vertical_alignment, line_height_ratio,
+            font_color_rgb, italic_font_color_rgb, bold_font_color_rgb
+        )
+        TextRendererUtility.draw_chunks(draw, chunks)
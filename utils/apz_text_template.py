@@ -0,0 +1,87 @@
+# utils/apz_text_template.py
+import re
+from ..utils.apz_rich_text_parser import parse_rich_text
+from ..utils.apz_text_metrics import shared_text_metrics
+
+class TextTemplateUtility:
+    """
+    Placeholders in theText that expand per frame: {frame} (start_frame + index),
+    {index} (position in the batch) and {timecode} (HH:MM:SS:FF at frame_rate).
+    Other text in braces is left as is.
+    """
+
+    PLACEHOLDER_RE = re.compile(r'\{(frame|index|timecode)\}')
+
+    @staticmethod
+    def has_placeholders(text):
+        return TextTemplateUtility.PLACEHOLDER_RE.search(text) is not None
+
+    @staticmethod
+    def frame_values(index, start_frame=0, frame_rate=24.0):
+        # Non-integer rates such as 29.97 count frames at the nominal rate (non-drop-frame)
+        frame = start_frame + index
+        rate = max(int(round(frame_rate)), 1)
+        seconds, frames = divmod(max(frame, 0), rate)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return {
+            "frame": str(frame),
+            "index": str(index),
+            "timecode": f"{hours:02d}:{minutes:02d}:{seconds:02d}:{frames:02d}",
+        }
+
+    @staticmethod
+    def expand(text, values):
+        return TextTemplateUtility.PLACEHOLDER_RE.sub(lambda match: values[match.group(1)], text)
+
+    @staticmethod
+    def reservations(frame_values):
+        """
+        Text that reserves room for each placeholder: its longest value over the frames with
+        every digit replaced by '0'. Digits are assumed to share one width, as in most fonts.
+        """
+        reserved = {}
+        for values in frame_values:
+            for name, value in values.items():
+                if len(value) > len(reserved.get(name, "")):
+                    reserved[name] = re.sub(r'[0-9]', '0', value)
+        return reserved
+
+    @staticmethod
+    def slot_value(name, values, reservations, dynamic_text):
+        # "fixed" pads numbers with zeros to the reserved length so every frame has as many digits
+        value = values[name]
+        if dynamic_text == "fixed":
+            value = value.rjust(len(reservations[name]), '0')
+        return value
+
+    @staticmethod
+    def parse_template(text, reservations):
+        """
+        parse_rich_text for a template: every placeholder becomes a part of its own holding
+        the reserved text, with its name as the style's slot.
+        """
+        parts = []
+        for part, styles in parse_rich_text(text):
+            position = 0
+            for match in TextTemplateUtility.PLACEHOLDER_RE.finditer(part):
+                if match.start() > position:
+                    parts.append((part[position:match.start()], styles))
+                parts.append((reservations[match.group(1)], styles.replace(slot=match.group(1))))
+                position = match.end()
+            if position < len(part) or not parts:
+                parts.append((part[position:], styles))
+        return parts
+
+    @staticmethod
+    def slot_layout(layout, values, dynamic_text):
+        """
+        Layout of one frame's placeholder values, drawn at the positions reserved in the
+        static layout. Only these runs are measured again; the rest of the text is not.
+        """
+        chunks = []
+        for slot in layout.slots:
+            value = TextTemplateUtility.slot_value(slot.slot, values, layout.reservations, dynamic_text)
+            bbox = shared_text_metrics.measure(slot.font, value).bbox
+            chunks.append(slot._replace(text=value, width=bbox[2] - bbox[0]))
+        return layout._replace(chunks=tuple(chunks), bounding_box=None, cache_key=None, slots=())
@@ -1,63 +1,229 @@
 # text_wrapper.py
-def wrap_text(parsed_text, font, max_width, line_height):
+from ..utils.apz_text_metrics import shared_text_metrics
+
+
+class _LineMeasure:
+    """
+    Running advance and bbox of the line being built, so that appending a word
+    costs cached lookups instead of measuring the whole line again.
+    """
+
+    def __init__(self, font):
+        self.set_font(font)
+        # Lines mixing fonts cannot be measured as one string, so they keep the estimate
+        self.exact = True
+        self.reset()
+
+    def set_font(self, font):
+        if hasattr(self, 'font'):
+            self.exact = False
+        self.font = font
+        # Estimates closer than this to max_width are checked with a real measurement
+        self.tolerance = max(2, getattr(font, 'size', 0) // 8)
+
+    def reset(self, token=""):
+        if token:
+            self.advance, self.left, self.right = self._measure(token)
+            self.last_char = token[-1]
+        else:
+            self.advance, self.left, self.right = 0.0, 0, 0
+            self.last_char = None
+
+    def _measure(self, token):
+        # (advance, bbox left, bbox right) of a single word or space, measured once per font
+        metrics = shared_text_metrics.measure(self.font, token)
+        return metrics.advance, metrics.bbox[0], metrics.bbox[2]
+
+    def _joined(self, advance, left, right, last_char, token):
+        # Metrics of the measured prefix followed by token
+        if not token:
+            return advance, left, right, last_char
+        token_advance, token_left, token_right = self._measure(token)
+        if last_char is None:
+            return token_advance, token_left, token_right, token[-1]
+        offset = advance + shared_text_metrics.kerning(self.font, last_char, token[0])
+        return (offset + token_advance, min(left, offset + token_left),
+                max(right, offset + token_right), token[-1])
+
+    def append(self, *tokens):
+        metrics = (self.advance, self.left, self.right, self.last_char)
+        for token in tokens:
+            metrics = self._joined(*metrics, token)
+        return metrics
+
+    def commit(self, metrics, bbox=None):
+        self.advance, self.left, self.right, self.last_char = metrics
+        if bbox is not None:
+            self.left, self.right = bbox[0], bbox[2]
+
+    def fits(self, test_line, metrics, max_width):
+        # Returns (fits, exact bbox or None)
+        width = metrics[2] - metrics[1]
+        if width <= max_width - self.tolerance:
+            return True, None
+        if width > max_width + self.tolerance:
+            return False, None
+        if not self.exact:
+            return width <= max_width, None
+        bbox = self.font.getbbox(test_line)
+        return bbox[2] - bbox[0] <= max_width, bbox
+
+
+def scaled_font_size(font_size, scale):
+    # Font size of a run inside <size=scale>
+    return max(1, round(font_size * scale))
+
+
+def line_scale(line_parts):
+    # A line is as tall as its largest run; lines without <size> runs have scale 1
+    return max((styles.get('scale') or 1 for word, styles in line_parts), default=1)
+
+
+def line_heights(wrapped_lines, line_height):
+    return [int(line_height * line_scale(line_parts)) for line, line_parts in wrapped_lines]
+
+
+def wrap_text(parsed_text, font, max_width, line_height, scaled_font=None):
+    """
+    Wraps parsed text to max_width with font. Runs with a size scale are measured with
+    scaled_font(scale) when it is given, and make their lines taller. Template slots are
+    wrapped as part of the words around them, like the expanded text would be.
+    """
     wrapped_lines = []
     current_line = ""
     line_parts = []
+    measure = _LineMeasure(font)
 
-    for text, styles in parsed_text:
+    def place_word(word, styles, followed_by_space, attach=False):
+        # attach continues the previous word without a space, across a slot boundary
+        nonlocal current_line, line_parts
+        if attach and not word:
+            if followed_by_space:
+                line_parts.append((' ', styles))
+            return
+        if current_line and attach:
+            test_line = current_line + word
+            metrics = measure.append(word)
+        elif current_line:
+            test_line = current_line + ' ' + word
+            metrics = measure.append(' ', word)
+        else:
+            test_line = word
+            metrics = measure.append(word)
+        fits, bbox = measure.fits(test_line, metrics, max_width)
+
+        if fits:
+            current_line = test_line
+            measure.commit(metrics, bbox)
+            if current_line.strip():
+                line_parts.append((word, styles))
+        else:
+            wrapped_lines.append((current_line, line_parts))
+            current_line = word
+            measure.reset(word)
+            line_parts = [(word, styles)]
+        if followed_by_space:
+            line_parts.append((' ', styles))
+
+    scaled = False
+    runs = list(parsed_text)
+    attach = False
+    for index, (text, styles) in enumerate(runs):
+        # Splitting a run at a slot must not add spaces: a space ending the run before a
+        # slot separates it from the slot, and a word cut by a slot continues after it.
+        # Where a tag also changes the style, the boundary is wrapped like any other.
+        joins_next = False
+        if index + 1 < len(runs):
+            next_styles = runs[index + 1][1]
+            if styles.get('slot') or next_styles.get('slot'):
+                joins_next = styles.replace(slot=None) is next_styles.replace(slot=None)
+        scale = styles.get('scale')
+        if scale:
+            scaled = True
+        run_font = scaled_font(scale) if scale and scaled_font is not None else font
+        if run_font is not measure.font:
+            measure.set_font(run_font)
         words = text.split(' ')
         for i, word in enumerate(words):
+            if joins_next and i > 0 and i == len(words) - 1 and not word:
+                break
+            attach_word = attach and i == 0
             if '\n' in word:
                 subwords = word.split('\n')
                 for j, subword in enumerate(subwords):
                     if j > 0:
                         wrapped_lines.append((current_line, line_parts))
                         current_line = ""
+                        measure.reset()
                         line_parts = []
-                    if current_line:
-                        test_line = current_line + ' ' + subword
-                    else:
-                        test_line = subword
-                    w = font.getbbox(test_line)[2] - font.getbbox(test_line)[0]
-
-                    if w <= max_width:
-                        current_line = test_line
-                        if current_line.strip():
-                            line_parts.append((subword, styles))
-                        if i < len(words) - 1 or j < len(subwords) - 1:
-                            line_parts.append((' ', styles))
-                    else:
-                        wrapped_lines.append((current_line, line_parts))
-                        current_line = subword
-                        line_parts = [(subword, styles)]
-                        if i < len(words) - 1 or j < len(subwords) - 1:
-                            line_parts.append((' ', styles))
+                    place_word(subword, styles, i < len(words) - 1 or j < len(subwords) - 1, attach_word and j == 0)
             else:
-                if current_line:
-                    test_line = current_line + ' ' + word
-                else:
-                    test_line = word
-                w = font.getbbox(test_line)[2] - font.getbbox(test_line)[0]
-
-                if w <= max_width:
-                    current_line = test_line
-                    if current_line.strip():
-                        line_parts.append((word, styles))
-                    if i < len(words) - 1:
-                        line_parts.append((' ', styles))
-                else:
-                    wrapped_lines.append((current_line, line_parts))
-                    current_line = word
-                    line_parts = [(word, styles)]
-                    if i < len(words) - 1:
-                        line_parts.append((' ', styles))
+                place_word(word, styles, i < len(words) - 1, attach_word)
 
-        if text.endswith(' '):
+        if text:
+            attach = joins_next and bool(words[-1])
+        if text.endswith(' ') and not joins_next:
             current_line += ' '
+            measure.commit(measure.append(' '))
             line_parts.append((' ', styles))
 
     if current_line:
         wrapped_lines.append((current_line, line_parts))
 
-    total_height = len(wrapped_lines) * line_height
+    if scaled:
+        total_height = sum(line_heights(wrapped_lines, line_height))
+    else:
+        total_height = len(wrapped_lines) * line_height
     return wrapped_lines, total_height
+
+
+# Events of wrap_events besides word indices
+LINE_BREAK = -1
+TRAILING_SPACE = -2
+
+
+def wrap_events(parsed_text):
+    """
+    Flattens parsed text into the sequence of steps wrap_text takes, independent of the
+    font: word indices into the returned list of distinct words, LINE_BREAK and TRAILING_SPACE.
+    """
+    events = []
+    word_indices = {}
+    for text, styles in parsed_text:
+        for i, word in enumerate(text.split(' ')):
+            for j, subword in enumerate(word.split('\n')):
+                if j > 0:
+                    events.append(LINE_BREAK)
+                events.append(word_indices.setdefault(subword, len(word_indices)))
+        if text.endswith(' '):
+            events.append(TRAILING_SPACE)
+    return events, list(word_indices)
+
+
+def count_wrapped_lines(events, words, word_widths, space_width, max_width):
+    """
+    Number of lines wrap_text would produce if lines were as wide as the sum of their
+    word and space widths. Used to estimate fitting sizes without measuring every line.
+    """
+    line_count = 0
+    line_width = 0.0
+    line_started = False  # wrap_text's `current_line` is non-empty
+    for event in events:
+        if event == LINE_BREAK:
+            line_count += 1
+            line_width, line_started = 0.0, False
+        elif event == TRAILING_SPACE:
+            line_width += space_width
+            line_started = True
+        else:
+            word_width = word_widths[event]
+            test_width = line_width + space_width + word_width if line_started else word_width
+            if test_width <= max_width:
+                line_width = test_width
+                line_started = line_started or bool(words[event])
+            else:
+                line_count += 1
+                line_width, line_started = word_width, bool(words[event])
+    if line_started:
+        line_count += 1
+    return line_count